@@ -0,0 +1,167 @@
+# Benchmarks for the enumeration and hyperbolicity kernels.
+# Run from the top of the repository:
+#
+#     python -m benchmarks.run [--only=NAME,...] [--repeat=N] [--out=FILE]
+#                              [--baseline=FILE] [--tolerance=X] [--save-baseline]
+#
+# Each benchmark runs repeat times (default 3), and we keep the fastest
+# wall time with its CPU time, together with a summary of its answer.
+# The results go to benchmarks/results.json, or to --out.
+# If the baseline (default benchmarks/baseline.json) exists, each benchmark
+# is compared with it: one more than tolerance (default 0.25) slower
+# than its baseline, or with a different answer, is a regression,
+# and the exit status is 1. --save-baseline writes the results
+# as the new baseline instead. No verdict cache is passed, the census
+# index is switched off, and the per-process memos are cleared before
+# every repeat, so each repeat does all of its work.
+
+import json
+import os
+import platform
+import sys
+from time import perf_counter, process_time
+import regina
+import snappy
+from enuminternals.bead import enumerate_isosigs
+from enuminternals.enuminternals import necklace_sig
+from enuminternals.ne import solve_problem_ne
+from enuminternals.t2i import is_T2xI, clear_T2xI_memos
+from enuminternals.quick_checks import clear_common_axis_memo
+import gordon.hyperbolicity
+from gordon.hyperbolicity import hyp_info
+from gordon.shortslopes import short_slopes
+from options import option, int_option
+
+BENCHMARK_FORMAT = 1
+
+here = os.path.dirname(os.path.abspath(__file__))
+beads = os.path.join(os.path.dirname(here), "enuminternals")
+
+# Known answers for is_T2xI, from t2i.py.
+t2i_sigs = ['gfLPIadfdefrdwun', 'mfLLjzLOQcdffhkjiljllrtariqtgvfg']
+non_t2i_sigs = ['hLLLQkbeegefgghhhhhhgb', 'bGaj']
+
+# (parent, cusp, slope) for hyp_info: exceptional and hyperbolic fillings.
+hyp_triples = [('m004', 0, (1,0)), ('m004', 0, (4,1)), ('m004', 0, (5,1)),
+               ('m003', 0, (1,0)), ('m007', 0, (3,1)), ('m006', 0, (4,1))]
+
+# (coefficients, bound) for short_slopes.
+slope_forms = [((1.0, 0.3, 2.5), 400.0), ((2, 1, 3), 100000)]
+
+def ne_sample(per_file=2):
+    """The first per_file link exteriors with 2 or 3 cusps
+    in each of bead4.json to bead7.json, simplified by necklace_sig."""
+    sample = []
+    for n in range(4, 8):
+        found = 0
+        fn = os.path.join(beads, "bead{0}.json".format(n))
+        with open(fn, 'r', encoding='utf-8') as f:
+            for line in f:
+                sig = line.strip() and necklace_sig(line.strip())
+                if sig:
+                    sample.append(sig)
+                    found += 1
+                    if found == per_file:
+                        break
+    return sample
+
+def bench_enumerate(n):
+    return len(enumerate_isosigs(n))
+
+def bench_ne(sigs):
+    # Randomized simplification should make the same choices every run.
+    regina.RandomEngine.reseedWithDefault()
+    return [sorted(solve_problem_ne(regina.Triangulation3(sig))) for sig in sigs]
+
+def bench_t2i():
+    return [is_T2xI(regina.Triangulation3(sig)) for sig in t2i_sigs + non_t2i_sigs]
+
+def bench_hyp_info():
+    return [bool(hyp_info(snappy.ManifoldHP(name), cusp, slope)[0])
+            for (name, cusp, slope) in hyp_triples]
+
+def bench_short_slopes():
+    return [len(short_slopes(Q, bound)) for (Q, bound) in slope_forms]
+
+def benchmarks():
+    """Returns a list of (name, function) pairs, in the order they run."""
+    B = [("enumerate_isosigs_{0}".format(n), lambda n=n: bench_enumerate(n))
+         for n in range(4, 7)]
+    sample = ne_sample()
+    B.append(("solve_problem_ne", lambda: bench_ne(sample)))
+    B.append(("is_T2xI", bench_t2i))
+    B.append(("hyp_info", bench_hyp_info))
+    B.append(("short_slopes", bench_short_slopes))
+    return B
+
+def reset():
+    """Forgets memoized verdicts, so each repeat does the work again."""
+    # None, rather than False, so that hyp_census never loads the index.
+    gordon.hyperbolicity.census_index = None
+    clear_T2xI_memos()
+    clear_common_axis_memo()
+
+def time_it(f, repeat):
+    best = None
+    for i in range(repeat):
+        reset()
+        wall, cpu = perf_counter(), process_time()
+        result = f()
+        wall, cpu = perf_counter() - wall, process_time() - cpu
+        if best is None or wall < best["wall"]:
+            best = {"wall": wall, "cpu": cpu, "result": result}
+    return best
+
+def compare(results, baseline, tolerance):
+    """Returns the regressions of results against baseline, as strings."""
+    regressions = []
+    for name, r in results.items():
+        if name not in baseline:
+            continue
+        b = baseline[name]
+        if r["result"] != b["result"]:
+            regressions.append("{0}: answer changed".format(name))
+        elif r["wall"] > (1 + tolerance) * b["wall"]:
+            s = "{0}: {1:.3f}s, baseline {2:.3f}s"
+            regressions.append(s.format(name, r["wall"], b["wall"]))
+    return regressions
+
+if __name__ == "__main__":
+    repeat = int_option(sys.argv, "--repeat", 3)
+    only = option(sys.argv, "--only")
+    out = option(sys.argv, "--out", os.path.join(here, "results.json"))
+    baseline_fn = option(sys.argv, "--baseline", os.path.join(here, "baseline.json"))
+    tolerance = float(option(sys.argv, "--tolerance", 0.25))
+
+    results = {}
+    for name, f in benchmarks():
+        if only is not None and name not in only.split(","):
+            continue
+        results[name] = time_it(f, repeat)
+        s = "{0}: {1:.3f}s wall, {2:.3f}s cpu"
+        print(s.format(name, results[name]["wall"], results[name]["cpu"]))
+    # Round-trip through JSON, so results compare equal to a saved baseline.
+    results = json.loads(json.dumps(results))
+    report = {"format": BENCHMARK_FORMAT,
+              "regina": regina.versionString(),
+              "snappy": snappy.__version__,
+              "python": platform.python_version(),
+              "machine": platform.machine(),
+              "repeat": repeat,
+              "benchmarks": results}
+
+    if "--save-baseline" in sys.argv:
+        out = baseline_fn
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=1)
+    print("Wrote {0}".format(out))
+
+    if "--save-baseline" not in sys.argv and os.path.exists(baseline_fn):
+        with open(baseline_fn, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)["benchmarks"]
+        regressions = compare(results, baseline, tolerance)
+        for r in regressions:
+            print("Regression: " + r)
+        if regressions:
+            sys.exit(1)
+        print("No regressions against {0}".format(baseline_fn))
@@ -0,0 +1,45 @@
+# Durable checkpoints for the long-running proof scripts.
+# Each unit of work is saved as a JSON file in a checkpoint directory
+# once it is complete, so that a rerun with --resume can skip it.
+
+import json
+import os
+from options import option
+
+def checkpoint_file(directory, unit):
+    return os.path.join(directory, unit + ".json")
+
+def load_checkpoint(directory, unit):
+    """Returns the value saved for unit, or None if there is none."""
+    fn = checkpoint_file(directory, unit)
+    if not os.path.exists(fn):
+        return None
+    with open(fn, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_checkpoint(directory, unit, value):
+    """Saves the JSON-serializable value for unit.
+    The file is replaced atomically, so a crash mid-write
+    leaves either the old checkpoint or the new one."""
+    os.makedirs(directory, exist_ok=True)
+    fn = checkpoint_file(directory, unit)
+    tmp = fn + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(value, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, fn)
+
+def resumed(directory, unit, resume):
+    """Returns the saved value for unit if resuming, else None."""
+    if not resume:
+        return None
+    value = load_checkpoint(directory, unit)
+    if value is not None:
+        print("*** Resuming: {0} already done. ***".format(unit))
+    return value
+
+def checkpoint_dir(argv):
+    """The directory given by --checkpoint-dir=DIR in argv,
+    or "checkpoints" by default."""
+    return option(argv, "--checkpoint-dir", "checkpoints")
@@ -28,27 +28,108 @@ def make_necklace(match):
             me.join(me_face,you,regina.Perm4(0,1))
     return ndipyr
 
+def perfect_matchings(R):
+    """Yields all perfect matchings on R as lists of pairs.
+    The first element of R is paired with each later element in turn,
+    and the rest of R is matched in the same way.
+    The same list is updated in place and yielded every time,
+    so callers wanting to keep a matching must copy it."""
+    n = len(R)
+    m = n // 2
+    if n % 2 == 1:
+        return
+    if m == 0:
+        yield []
+        return
+    free = [True] * n
+    xs = [0] * m     # position in R of the first element of pair k
+    ys = [0] * m     # position in R of its partner
+    buf = [None] * m
+    free[0] = False
+    k = 0
+    while k >= 0:
+        y = ys[k]
+        if y != xs[k]:
+            free[y] = True
+        y += 1
+        while y < n and not free[y]:
+            y += 1
+        if y == n:
+            free[xs[k]] = True
+            k -= 1
+            continue
+        free[y] = False
+        ys[k] = y
+        buf[k] = (R[xs[k]], R[y])
+        if k == m - 1:
+            yield buf
+        else:
+            x = xs[k] + 1
+            while not free[x]:
+                x += 1
+            k += 1
+            free[x] = False
+            xs[k] = x
+            ys[k] = x
+
 def pfm(L,R,f):
     """Do f(L + M) for all perfect matchings M on R."""
-    if R == []:
-        f(L)
-    else:
-        x = R[0]
-        for i in range(1,len(R)):
-            y = R[i]
-            Rpmy = R[1:i] + R[i+1:]
-            pfm(L+[(x,y)], Rpmy, f)
+    for M in perfect_matchings(R):
+        f(L + M)
 
 def for_all_perfect_matchings(X, f):
-    pfm([], X, [], f)
+    pfm([], X, f)
+
+def necklace_symmetries(n):
+    """Returns the relabellings of faces 0..2n-1 induced by symmetries
+    of the n-bead dipyramid, as lists g with g[label] the new label.
+    These are the rotations and reflections of the necklace,
+    together with the exchange of faces 0 and 1 in every tetrahedron.
+    Each carries make_necklace(M) to an isomorphic triangulation."""
+    syms = []
+    for s in range(n):
+        for reflect in (False, True):
+            for flip in (0, 1):
+                g = []
+                for label in range(2*n):
+                    tet, face = label // 2, label % 2
+                    tet = (s - tet) % n if reflect else (tet + s) % n
+                    g.append(2*tet + (face ^ flip))
+                syms.append(g)
+    return syms
 
-def enumerate_isosigs(n):
-    labels = list(range(2*n))
+def normal_form(match, g):
+    return sorted((min(g[i],g[j]), max(g[i],g[j])) for (i,j) in match)
+
+def is_canonical(match, syms):
+    """Whether match is the least matching in its orbit under syms.
+    Here match must be sorted, with each pair sorted,
+    as those from perfect_matchings(list(range(2n))) are."""
+    for g in syms:
+        if normal_form(match, g) < match:
+            return False
+    return True
+
+def canonical_matchings(n):
+    """Yields one perfect matching of the 2n faces
+    from each orbit of necklace_symmetries(n)."""
+    syms = necklace_symmetries(n)
+    for M in perfect_matchings(list(range(2*n))):
+        if is_canonical(M, syms):
+            yield list(M)
+
+def enumerate_isosigs(n, prune=True):
+    """Returns a dict from isosigs of n-bead necklaces to matchings.
+    With prune, only one matching per symmetry orbit is triangulated;
+    the set of isosigs is the same either way."""
+    if prune:
+        matchings = canonical_matchings(n)
+    else:
+        matchings = perfect_matchings(list(range(2*n)))
     sigs = {}
-    def put_in_sigs(p):
+    for p in matchings:
         mfld = make_necklace(p)
-        sigs[mfld.isoSig()] = p
-    for_all_perfect_matchings(labels, put_in_sigs)
+        sigs[mfld.isoSig()] = list(p)
     return sigs
 
 import sys
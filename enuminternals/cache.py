@@ -0,0 +1,65 @@
+import json
+import os
+import sqlite3
+import regina
+
+# Bump this whenever a change to the code alters what gets cached.
+CACHE_FORMAT = 1
+
+def default_cache_path():
+    """The cache database used by the scripts.
+    It can be moved by setting LOW_CUSP_VOLUME_CACHE."""
+    path = os.environ.get("LOW_CUSP_VOLUME_CACHE")
+    if path:
+        return path
+    return os.path.join(os.path.expanduser("~"), ".cache",
+                        "low-cusp-volume", "results.sqlite")
+
+def regina_stamp():
+    return "{0}:regina-{1}".format(CACHE_FORMAT, regina.versionString())
+
+# One connection per path per process.
+# Connections must not cross a fork, so we remember the pid too.
+_connections = {}
+
+def open_cache(path):
+    key = (path, os.getpid())
+    if key not in _connections:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        db = sqlite3.connect(path, timeout=600)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("CREATE TABLE IF NOT EXISTS results "
+                   "(kind TEXT, stamp TEXT, key TEXT, value TEXT, "
+                   "PRIMARY KEY (kind, stamp, key))")
+        db.commit()
+        _connections[key] = db
+    return _connections[key]
+
+def cache_get(path, kind, stamp, key):
+    """Returns the value stored under key, or None if there is none.
+    Entries written under a different stamp are invisible."""
+    if path is None:
+        return None
+    row = open_cache(path).execute(
+        "SELECT value FROM results WHERE kind=? AND stamp=? AND key=?",
+        (kind, stamp, key)).fetchone()
+    if row is None:
+        return None
+    return json.loads(row[0])
+
+def cache_keys(path, kind):
+    """Returns the keys of kind stored under any stamp."""
+    rows = open_cache(path).execute(
+        "SELECT DISTINCT key FROM results WHERE kind=?", (kind,)).fetchall()
+    return [row[0] for row in rows]
+
+def cache_put(path, kind, stamp, key, value):
+    """Stores the JSON-serializable value under key."""
+    if path is None:
+        return
+    db = open_cache(path)
+    db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+               (kind, stamp, key, json.dumps(value)))
+    db.commit()
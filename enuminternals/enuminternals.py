@@ -1,11 +1,94 @@
 import regina
 import sys
+from multiprocessing import Pool
+from .events import event, simplify
+from .prepared import prepare
 from .faultfinding import *
 from .quick_checks import *
 from .bead import *
 from .ne import *
 
-def enumerate_internal_necklaces(bead, verbose=True):
+def necklace_sig(match_sig):
+    """Returns the simplified sig of match_sig if it is a generalized
+    link exterior with 2 or 3 cusps, and None otherwise.
+    The sig keys the persistent cache, so it must not depend on what ran
+    before, e.g. on beads skipped by --resume or on the number of workers.
+    Hence we simplify from a fixed random state."""
+    regina.RandomEngine.reseedWithDefault()
+    mfld = regina.Triangulation3(match_sig)
+    simplify(mfld)
+    P = prepare(mfld)
+    if not is_nontrivial_link_exterior(P):
+        return None
+    # full necklace structures always have 2 or 3 cusps
+    if P.boundary_count not in (2, 3):
+        return None
+    return P.sig
+
+# Each process keeps its own memo of solve_problem_ne subproblems.
+# enumerate_internal_necklaces starts every run with a fresh one,
+# which worker processes inherit when the pool is started.
+subproblem_memo = SubproblemMemo()
+
+def ancestral_sigs(sig, verbose=False, cache=None, stream=False,
+                   trials=20, patience=None, trial_workers=None):
+    """Returns solve_problem_ne of sig, along with the numbers of
+    subproblem memo hits and misses incurred."""
+    mfld = regina.Triangulation3(sig)
+    hits, misses = subproblem_memo.hits, subproblem_memo.misses
+    X = cached_solve_problem_ne(mfld, verbose, cache, subproblem_memo, stream,
+                                trials, patience, trial_workers)
+    return (X, subproblem_memo.hits - hits, subproblem_memo.misses - misses)
+
+def census_lookup(mfld):
+    with event("census", isosig=mfld.isoSig, tetrahedra=mfld.size) as e:
+        hits = regina.Census.lookup(mfld)
+        e.set(outcome=len(hits))
+    return hits
+
+def census_name(ne_sig):
+    mfld = regina.Triangulation3(ne_sig)
+    hits = census_lookup(mfld)
+    if len(hits) == 0:
+        # hLLAMkbeddfggghhbgahha is s441.
+        # Simplifying harder shows this is true.
+        simplify(mfld, 2)
+        hits = census_lookup(mfld)
+    return hits[0].name()
+
+def _call(job):
+    f, args = job
+    # Regina's simplification is randomized. Starting every job from
+    # the same random state makes its result depend on its input alone,
+    # not on which jobs a process happened to run before it.
+    regina.RandomEngine.reseedWithDefault()
+    return f(*args)
+
+def map_in_order(f, arglists, workers=None):
+    """Returns [f(*args) for args in arglists], computed on a pool
+    of the given number of worker processes if workers > 1.
+    Results are always in the order of arglists, and are the same
+    whether or not a pool is used."""
+    jobs = [(f, args) for args in arglists]
+    if workers is None or workers <= 1 or len(jobs) <= 1:
+        return [_call(job) for job in jobs]
+    chunksize = max(1, len(jobs) // (4 * workers))
+    with Pool(workers) as pool:
+        return pool.map(_call, jobs, chunksize)
+
+def enumerate_internal_necklaces(bead, verbose=True, workers=None, cache=None,
+                                 stream=False, trials=20, patience=None,
+                                 trial_workers=None):
+    """Returns a dict from census names of the hyp. ancestral set
+    for bead-bead necklaces to matchings realizing them.
+    With workers > 1, the per-signature work runs on a process pool;
+    results are merged in the same order as in the serial case.
+    If cache is a path, solve_problem_ne results are kept there.
+    stream, trials and patience are passed on to solve_problem_ne,
+    as is trial_workers as its workers, but only when workers is not
+    above 1, since pool workers cannot start pools of their own."""
+    global subproblem_memo
+    subproblem_memo = SubproblemMemo()
     neckl_sigs = {}
     if verbose:
         print("We abbreviate enumerate_internal_necklaces to e_i_n.")
@@ -13,24 +96,35 @@ def enumerate_internal_necklaces(bead, verbose=True):
     match_sigs = enumerate_isosigs(bead)
     if verbose:
         print("e_i_n, {0} beads: Getting isosigs for generalized link exteriors with 2 or 3 cusps...".format(bead))
-    for match_sig in match_sigs:
-        mfld = regina.Triangulation3(match_sig)
-        mfld.intelligentSimplify()
-        sig = mfld.isoSig()
-        if sig in neckl_sigs:
-            continue
-        if not is_nontrivial_link_exterior(mfld):
-            continue
-        # full necklace structures always have 2 or 3 cusps
-        if mfld.countBoundaryComponents() not in (2, 3):
+    sigs = map_in_order(necklace_sig,
+                        [(match_sig,) for match_sig in match_sigs],
+                        workers)
+    for match_sig, sig in zip(match_sigs, sigs):
+        if sig is None or sig in neckl_sigs:
             continue
         neckl_sigs[sig] = match_sigs[match_sig]
     if verbose:
+        print("e_i_n, {0} beads: Screening for common axis obstructions...".format(bead))
+    # Obstructed sigs have empty ancestral sets, so need no surface work.
+    obstructed = common_axis_screen(list(neckl_sigs), workers)
+    solvable = [sig for sig in neckl_sigs if not obstructed[sig]]
+    if verbose:
+        s = "e_i_n, {0} beads: {1} of {2} sigs obstructed"
+        print(s.format(bead, len(neckl_sigs) - len(solvable), len(neckl_sigs)))
         print("e_i_n, {0} beads: Finding hyp. ancestral set...".format(bead))
     ne_sigs = {}
-    for sig in neckl_sigs:
-        mfld = regina.Triangulation3(sig)
-        X = solve_problem_ne(mfld, verbose)
+    if workers is not None and workers > 1:
+        trial_workers = None
+    results = map_in_order(ancestral_sigs,
+                           [(sig, verbose, cache, stream, trials, patience,
+                             trial_workers) for sig in solvable],
+                           workers)
+    hits = sum(r[1] for r in results)
+    misses = sum(r[2] for r in results)
+    if verbose:
+        s = "e_i_n, {0} beads: subproblem memo: {1} hits, {2} misses"
+        print(s.format(bead, hits, misses))
+    for sig, (X, _, _) in zip(solvable, results):
         for ne_sig in X:
             if not ne_sig in ne_sigs:
                 if verbose:
@@ -39,15 +133,10 @@ def enumerate_internal_necklaces(bead, verbose=True):
                 ne_sigs[ne_sig] = neckl_sigs[sig]
     names = {}
     print("e_i_n, {0} beads: Recognizing signatures...".format(bead))
-    for ne_sig in ne_sigs:
-        mfld = regina.Triangulation3(ne_sig)
-        hits = regina.Census.lookup(mfld)
-        if len(hits) == 0:
-            # hLLAMkbeddfggghhbgahha is s441.
-            # Simplifying harder shows this is true.
-            mfld.simplifyExhaustive(2)
-            hits = regina.Census.lookup(mfld)
-        name_with_stuff = hits[0].name()
+    names_with_stuff = map_in_order(census_name,
+                                    [(ne_sig,) for ne_sig in ne_sigs],
+                                    workers)
+    for ne_sig, name_with_stuff in zip(ne_sigs, names_with_stuff):
         if verbose:
             print(name_with_stuff)
         name = name_with_stuff.split(' ')[0]
@@ -57,7 +146,9 @@ def enumerate_internal_necklaces(bead, verbose=True):
     return names
 
 if __name__ == "__main__":
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else None
     neckls = set()
     for bead in [4,5,6,7]:
-        neckls = neckls.union(enumerate_internal_necklaces(bead, verbose=True))
+        neckls = neckls.union(enumerate_internal_necklaces(bead, verbose=True,
+                                                          workers=workers))
     print(neckls)
@@ -0,0 +1,91 @@
+# Structured timing events, written one JSON object per line.
+#
+# Events are off unless the environment variable LOW_CUSP_VOLUME_EVENTS
+# names a file, or enable_events is called. While they are off,
+# event returns a shared do-nothing context manager, and field values
+# given as callables are never called, so instrumented code pays
+# for little more than a function call.
+#
+# Each event has the fields
+#     stage, isosig, tetrahedra, surfaces, wall, cpu, outcome, pid
+# where wall and cpu are elapsed seconds, and fields that do not apply
+# to a stage are null. Many processes may append to the same file.
+
+import json
+import os
+import time
+
+events_path = os.environ.get("LOW_CUSP_VOLUME_EVENTS") or None
+
+def enable_events(path):
+    """Starts writing events to path; None stops."""
+    global events_path
+    events_path = path
+
+def resolved(fields):
+    return {k: (v() if callable(v) else v) for (k, v) in fields.items()}
+
+class Event:
+    """A stage being timed. Fields given to event are resolved on entry,
+    so they describe the input; fields given to set are resolved on exit,
+    so they may describe the result."""
+
+    def __init__(self, stage, fields):
+        self.record = {"stage": stage, "isosig": None, "tetrahedra": None,
+                       "surfaces": None, "outcome": None}
+        self.fields = fields
+        self.later = {}
+
+    def set(self, **fields):
+        self.later.update(fields)
+
+    def __enter__(self):
+        self.record.update(resolved(self.fields))
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, kind, value, tb):
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        self.record.update(resolved(self.later))
+        if kind is GeneratorExit:
+            # The consumer of an enumeration stopped early.
+            self.record["outcome"] = "stopped"
+        elif kind is not None:
+            self.record["outcome"] = kind.__name__
+        self.record.update({"wall": wall, "cpu": cpu, "pid": os.getpid()})
+        path = events_path
+        if path is not None:
+            with open(path, 'a') as f:
+                f.write(json.dumps(self.record, default=str) + '\n')
+        return False
+
+class NoEvent:
+    def set(self, **fields):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, value, tb):
+        return False
+
+no_event = NoEvent()
+
+def event(stage, **fields):
+    """Returns a context manager timing stage, or no_event if events are off.
+    Field values may be callables, called only when events are on."""
+    if events_path is None:
+        return no_event
+    return Event(stage, fields)
+
+def simplify(T, exhaustive=None):
+    """Simplifies the Regina triangulation T in place, as a simplify event.
+    With exhaustive, uses simplifyExhaustive with that height instead."""
+    with event("simplify", isosig=T.isoSig, tetrahedra=T.size) as e:
+        if exhaustive is None:
+            T.intelligentSimplify()
+        else:
+            T.simplifyExhaustive(exhaustive)
+        e.set(outcome=T.size)
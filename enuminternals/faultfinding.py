@@ -1,91 +1,213 @@
 import regina
+from functools import cached_property
 from .t2i import is_T2xI
-       
+from .events import event, simplify
+from .prepared import prepare
+
+class ClassifiedSurface:
+    """A normal surface together with its fault classification.
+    Every attribute is computed on first use, so the cheap invariants
+    settle most tests, the surface is cut at most once, and the cut
+    triangulation is shared by all the fault tests."""
+
+    def __init__(self, surf, index=None, source=None):
+        self.surface = surf
+        self.index = index
+        # Whatever surf came from, kept alive for as long as surf is.
+        self.source = source
+
+    @cached_property
+    def euler(self):
+        return self.surface.eulerChar()
+
+    @cached_property
+    def connected(self):
+        return self.surface.isConnected()
+
+    @cached_property
+    def compact(self):
+        return self.surface.isCompact()
+
+    @cached_property
+    def orientable(self):
+        return self.surface.isOrientable()
+
+    @cached_property
+    def closed(self):
+        return not self.surface.hasRealBoundary()
+
+    @cached_property
+    def cut(self):
+        T = self.surface.triangulation()
+        with event("cut", isosig=T.isoSig, tetrahedra=T.size) as e:
+            cut = self.surface.cutAlong()
+            e.set(outcome=cut.size)
+        return cut
+
+    @cached_property
+    def cut_connected(self):
+        return self.cut.isConnected()
+
+    @cached_property
+    def simplified_cut(self):
+        simplify(self.cut)
+        return self.cut
+
+    @cached_property
+    def components(self):
+        return self.simplified_cut.triangulateComponents()
+
+    @cached_property
+    def summands(self):
+        return unsum_cut(self.simplified_cut)
+
+    @cached_property
+    def is_nonseparating_fault(self):
+        return (self.compact
+                and self.euler >= 0
+                and self.cut_connected)
+
+    @cached_property
+    def is_nonseparating_closed_fault(self):
+        return self.closed and self.is_nonseparating_fault
+
+    @cached_property
+    def is_nonseparating_nonclosed_fault(self):
+        return not self.closed and self.is_nonseparating_fault
+
+    @cached_property
+    def is_sphere(self):
+        return (self.connected
+                and self.compact
+                and self.euler == 2)
+
+    @cached_property
+    def is_essential_sphere(self):
+        if not self.is_sphere:
+            return False
+        if self.cut_connected:
+            return True
+        Lsig, Rsig = self.summands
+        L = regina.Triangulation3(Lsig)
+        R = regina.Triangulation3(Rsig)
+        if L.isSphere() or R.isSphere():
+            return False
+        return True
+
+    @cached_property
+    def is_torus(self):
+        return (self.connected
+                and self.compact
+                and self.orientable
+                and self.closed
+                and self.euler == 0)
+
+    @cached_property
+    def is_torus_fault(self):
+        if not self.is_torus:
+            return False
+        if self.simplified_cut.hasCompressingDisc():
+            return False
+        if self.cut_connected:
+            return True
+        L, R = self.components
+        if is_T2xI(L) or is_T2xI(R):
+            return False
+        return True
+
+    @cached_property
+    def is_mobius_band(self):
+        return (self.connected
+                and self.compact
+                and not self.orientable
+                and not self.closed
+                and self.euler == 0)
+
+    @cached_property
+    def is_annulus(self):
+        return (self.connected
+                and self.compact
+                and self.orientable
+                and not self.closed
+                and self.euler == 0)
+
+    @cached_property
+    def is_solid_torus_annulus(self):
+        if not self.is_annulus:
+            return False
+        if self.cut_connected:
+            return False
+        L, R = self.components
+        if L.isSolidTorus() and R.isSolidTorus():
+            return True
+        return False
+
+def vertex_surfaces(M, stream=False):
+    """Yields a ClassifiedSurface for each quad vertex normal surface of M.
+    Normally these come from the full list regina.NormalSurfaces builds.
+    With stream, they come one at a time from Regina's tree traversal
+    enumeration as it finds them, so a caller that stops early
+    never pays for the rest of the enumeration."""
+    if stream:
+        # This event also spans whatever the caller does with each surface.
+        with event("enumerate_stream", isosig=M.isoSig, tetrahedra=M.size) as e:
+            enc = regina.NormalEncoding(regina.NS_QUAD)
+            search = regina.TreeEnumeration(M, enc)
+            i = 0
+            while search.next():
+                e.set(surfaces=i + 1)
+                yield ClassifiedSurface(search.buildSurface(), i, search)
+                i += 1
+            e.set(surfaces=i, outcome="complete")
+    else:
+        with event("enumerate", isosig=M.isoSig, tetrahedra=M.size) as e:
+            F = regina.NormalSurfaces(M, regina.NS_QUAD, regina.NS_VERTEX)
+            e.set(surfaces=F.size)
+        for i in range(F.size()):
+            yield ClassifiedSurface(F.surface(i), i, F)
+
+def find_classified(test, C):
+    """Returns the first element of C passing test,
+    the name of a ClassifiedSurface attribute, or None."""
+    for S in C:
+        if getattr(S, test):
+            return S
+    else:
+        return None
+
 def is_nonseparating_fault(surf):
-    T = surf.cutAlong()
-    isFault = surf.eulerChar() >= 0
-    return (T.isConnected() and
-            surf.isCompact() and
-            isFault)
+    return ClassifiedSurface(surf).is_nonseparating_fault
 
 def is_nonseparating_closed_fault(surf):
-    isClosed = not surf.hasRealBoundary()
-    return isClosed and is_nonseparating_fault(surf)
+    return ClassifiedSurface(surf).is_nonseparating_closed_fault
 
 def is_nonseparating_nonclosed_fault(surf):
-    isNotClosed = surf.hasRealBoundary()
-    return isNotClosed and is_nonseparating_fault(surf)
+    return ClassifiedSurface(surf).is_nonseparating_nonclosed_fault
 
 def is_sphere(surf):
-    return (surf.isConnected()
-            and surf.isCompact()
-            and surf.eulerChar() == 2)
+    return ClassifiedSurface(surf).is_sphere
 
-def unsum(sphere):
-    T = sphere.cutAlong()
+def unsum_cut(T):
+    """Returns sigs of the two pieces of T, cut along a separating sphere,
+    with their boundary spheres capped off."""
     L, R = T.triangulateComponents()
-    L.finiteToIdeal()
-    L.intelligentSimplify()
-    L.idealToFinite()
-    L.intelligentSimplify()
-    R.finiteToIdeal()
-    R.intelligentSimplify()
-    R.idealToFinite()
-    R.intelligentSimplify()
-    return (L.isoSig(), R.isoSig())
+    return (capped_sig(L), capped_sig(R))
+
+def capped_sig(T):
+    """The material isosig of T with its boundary spheres capped off."""
+    return prepare(prepare(T).ideal).material_sig
+
+def unsum(sphere):
+    return unsum_cut(ClassifiedSurface(sphere).cut)
 
 def is_essential_sphere(surf):
-    if not is_sphere(surf):
-        return False
-    T = surf.cutAlong()
-    if T.isConnected():
-        return True
-    Lsig, Rsig = unsum(surf)
-    L = regina.Triangulation3(Lsig)
-    R = regina.Triangulation3(Rsig)
-    if L.isSphere() or R.isSphere():
-        return False
-    return True
+    return ClassifiedSurface(surf).is_essential_sphere
 
 def is_torus_fault(surf):
-    is_torus = (surf.isConnected()
-                and surf.isCompact()
-                and surf.isOrientable()
-                and not surf.hasRealBoundary()
-                and surf.eulerChar() == 0)
-    if not is_torus:
-        return False
-    T = surf.cutAlong()
-    T.intelligentSimplify()
-    if T.hasCompressingDisc():
-        return False
-    if T.isConnected():
-        return True
-    L, R = T.triangulateComponents()
-    if is_T2xI(L) or is_T2xI(R):
-        return False
-    return True
+    return ClassifiedSurface(surf).is_torus_fault
 
 def is_mobius_band(surf):
-    return (surf.isConnected()
-            and surf.isCompact()
-            and not surf.isOrientable()
-            and surf.hasRealBoundary()
-            and surf.eulerChar() == 0)
+    return ClassifiedSurface(surf).is_mobius_band
 
 def is_solid_torus_annulus(surf):
-    is_annulus = (surf.isConnected()
-                  and surf.isCompact()
-                  and surf.isOrientable()
-                  and surf.hasRealBoundary()
-                  and surf.eulerChar() == 0)
-    if not is_annulus:
-        return False
-    T = surf.cutAlong()
-    T.intelligentSimplify()
-    if T.isConnected():
-        return False
-    L, R = T.triangulateComponents()
-    if L.isSolidTorus() and R.isSolidTorus():
-        return True
-    return False
+    return ClassifiedSurface(surf).is_solid_torus_annulus
@@ -1,22 +1,136 @@
 import regina
+from collections import deque
+from multiprocessing import Pool
+from .events import simplify
+from .prepared import prepare
 from .faultfinding import *
 from .quick_checks import is_nontrivial_link_exterior, is_closed_oriented, has_common_axis_obstruction
+from .cache import cache_get, cache_put, regina_stamp
 
-def find_from(predicate, F):
-    n = F.size()
-    for i in range(n):
-        surf = F.surface(i)
-        if predicate(surf):
-            return i
-    else:
+class SubproblemMemo:
+    """Outcomes of solve_problem_ne, keyed by isosig,
+    shared among the calls (and recursive calls) that are given it."""
+
+    def __init__(self):
+        self.table = {}
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, *sigs):
+        for sig in sigs:
+            if sig in self.table:
+                return self.table[sig]
         return None
 
-def solve_problem_ne(mfld, verbose=False):
+    def store(self, sigs, outcome):
+        for sig in sigs:
+            self.table[sig] = outcome
+
+def recall(outcome):
+    kind, value = outcome
+    if kind == "error":
+        raise value
+    return set(value)
+
+# Random draws skipped between the starting states of successive
+# trials on a pool. Seeding trial i costs i * TRIAL_STRIDE draws.
+TRIAL_STRIDE = 1000
+
+def seed_trial(i):
+    """Puts Regina's random engine in a state depending on i alone,
+    and different for different i."""
+    regina.RandomEngine.reseedWithDefault()
+    for k in range(i * TRIAL_STRIDE):
+        regina.RandomEngine.rand(2)
+
+def simplify_trial(sig):
+    mu = regina.Triangulation3(sig)
+    mu.idealToFinite()
+    simplify(mu)
+    return (mu.countTetrahedra(), mu.isoSig())
+
+def seeded_simplify_trial(job):
+    sig, i = job
+    seed_trial(i)
+    return simplify_trial(sig)
+
+def pooled_trials(pool, sig, trials, ahead):
+    """Yields the results of trials 0, 1, ... of sig on pool, in order,
+    with at most ahead of them submitted and not yet yielded,
+    so that stopping early leaves little work behind."""
+    pending = deque()
+    i = 0
+    while i < trials or pending:
+        while i < trials and len(pending) < ahead:
+            pending.append(pool.apply_async(seeded_simplify_trial, ((sig, i),)))
+            i += 1
+        yield pending.popleft().get()
+
+def best_material_sig(sig, trials=20, patience=None, workers=None, pool=None):
+    """Returns the least (number of tetrahedra, isosig) among up to
+    trials randomized simplifications of sig to a material triangulation.
+    With patience, stops after that many consecutive trials without
+    fewer tetrahedra. Trials are examined in order.
+    Serially, the trials follow one another from Regina's default seed.
+    With workers > 1, they run on pool, or on a pool of their own
+    if pool is None, and trial i is seeded by i alone.
+    Either way the result depends on sig alone, but serial and
+    pooled runs may choose differently.
+    Afterwards Regina's random engine is left in its default state."""
+    regina.RandomEngine.reseedWithDefault()
+    own_pool = None
+    if workers is None or workers <= 1:
+        results = (simplify_trial(sig) for i in range(trials))
+    else:
+        if pool is None:
+            pool = own_pool = Pool(workers)
+        results = pooled_trials(pool, sig, trials, workers)
+    best = None
+    stale = 0
+    try:
+        for result in results:
+            if best is not None and result[0] >= best[0]:
+                stale += 1
+            else:
+                stale = 0
+            if best is None or result < best:
+                best = result
+            if patience is not None and stale >= patience:
+                break
+    finally:
+        results.close()
+        if own_pool is not None:
+            own_pool.terminate()
+    regina.RandomEngine.reseedWithDefault()
+    return best
+
+def solve_problem_ne(mfld, verbose=False, memo=None, stream=False,
+                     trials=20, patience=None, workers=None, pool=None):
     """Returns a set containing sigs whose manifolds constitute
     an ancestral set for the finite-volume hyperbolic manifolds into
-    which mfld embeds nonelementarily."""
-    assert is_nontrivial_link_exterior(mfld) or is_closed_oriented(mfld)
-    sig = mfld.isoSig()
+    which mfld embeds nonelementarily.
+    If memo is a SubproblemMemo, pieces already solved with it,
+    as recognized by given or material isosig, are looked up.
+    With stream, vertex normal surfaces are examined as they are
+    enumerated, rather than after enumeration finishes.
+    Only an empty answer due to a nonseparating closed fault is sure
+    to be the same either way: streamed surfaces come in another order,
+    so a different fault may be cut along, giving different sigs.
+    The remaining options are passed to best_material_sig.
+    With workers > 1 and no pool, one pool is made here
+    and shared by all the recursive calls."""
+    P = prepare(mfld)
+    sig = P.sig
+    if memo is not None:
+        outcome = memo.lookup(sig)
+        if outcome is not None:
+            memo.hits += 1
+            return recall(outcome)
+    if workers is not None and workers > 1 and pool is None:
+        with Pool(workers) as pool:
+            return solve_problem_ne(P, verbose, memo, stream,
+                                    trials, patience, workers, pool)
+    assert is_nontrivial_link_exterior(P) or is_closed_oriented(P)
 
     # Regina's simplification algorithm is
     # randomized, and does not always return the
@@ -29,58 +143,76 @@ def solve_problem_ne(mfld, verbose=False):
     # We found it most economical to place
     # this simplification here, rather than at the
     # end of every cutting operation.
-    musigs = []
-    for i in range(20):
-        mu = regina.Triangulation3(sig)
-        mu.idealToFinite()
-        mu.intelligentSimplify()
-        musigs.append((mu.countTetrahedra(),mu.isoSig()))
-    musigs.sort()
-    M = regina.Triangulation3(musigs[0][1])
+    # The trials start from the truncation, computed here once.
+    musig = best_material_sig(P.truncated_sig, trials, patience, workers, pool)
+    M = regina.Triangulation3(musig[1])
     material_sig = M.isoSig()
 
-    if has_common_axis_obstruction(M) or has_common_axis_obstruction(mfld):
+    if memo is not None:
+        outcome = memo.lookup(material_sig)
+        if outcome is not None:
+            memo.hits += 1
+            memo.store([sig], outcome)
+            return recall(outcome)
+        memo.misses += 1
+    try:
+        solve = lambda N: solve_problem_ne(N, verbose, memo, stream,
+                                           trials, patience, workers, pool)
+        X = solve_material(P, M, material_sig, verbose, stream, solve)
+    except Exception as x:
+        if memo is not None:
+            memo.store([sig, material_sig], ("error", x))
+        raise
+    if memo is not None:
+        memo.store([sig, material_sig], ("sigs", frozenset(X)))
+    return X
+
+def solve_material(P, M, material_sig, verbose, stream, solve):
+    """The body of solve_problem_ne for the PreparedManifold P,
+    once M is chosen. Pieces are handed to solve."""
+    sig = P.sig
+    if has_common_axis_obstruction(M) or has_common_axis_obstruction(P):
         # No nonelementary embeddings.
         if verbose:
             print("ne: {0}: common axis obstruction".format(sig))
         return set()
-    mu = regina.Triangulation3(sig)
-    mu.finiteToIdeal()
-    mu.intelligentSimplify()
 
-    if mu.hasStrictAngleStructure():
+    if P.has_strict_angle_structure:
         if verbose:
             print("ne: {0}: strict angle structure".format(sig))
-        return set([mu.isoSig()])
-
-    nsl = regina.NormalSurfaces
+        return set([P.ideal_sig])
 
     coords = regina.NS_QUAD
     solutions = regina.NS_VERTEX
     print(f"Enumerating {coords} {solutions} for {sig} : {material_sig}")
-    F = nsl(M, coords, solutions)
-
-    idx = find_from(is_nonseparating_closed_fault, F)
-    if idx != None:
-        if verbose:
-            s = "ne: {0} homeo. {1}: nonsep. at index {2} in {1}"
-            print(s.format(sig, material_sig,idx))
-        return set()
+    # Each surface is cut at most once, whichever tests it meets.
+    # A nonseparating closed fault settles the problem wherever it occurs;
+    # when streaming, we stop the enumeration at the first one.
+    # Every other test must wait until there is none, and so for
+    # the whole enumeration. Even then the order of C, and so which
+    # surface each test finds first, depends on streaming.
+    C = []
+    for S in vertex_surfaces(M, stream):
+        C.append(S)
+        if S.is_nonseparating_closed_fault:
+            if verbose:
+                s = "ne: {0} homeo. {1}: nonsep. at index {2} in {1}"
+                print(s.format(sig, material_sig, S.index))
+            return set()
     if verbose:
         print("no nonsep in {}".format(material_sig))
 
-    idx = find_from(is_essential_sphere, F)
-    if idx != None:
-        S = F.surface(idx)
+    S = find_classified('is_essential_sphere', C)
+    if S is not None:
         # The appeal to signatures ensures there are
         # no references to objects deleted after the call to unSum.
-        Lsig,Rsig = unsum(S)
+        Lsig,Rsig = S.summands
         L = regina.Triangulation3(Lsig)
         R = regina.Triangulation3(Rsig)
         if verbose:
             s = "ne: {0} homeo. {1}: reducing S2 at index {2} in {1}"
-            print(s.format(sig, material_sig, idx))
-        return solve_problem_ne(L,verbose).union(solve_problem_ne(R,verbose))
+            print(s.format(sig, material_sig, S.index))
+        return solve(L).union(solve(R))
     if verbose:
         print("{} is irreducible".format(material_sig))
 
@@ -91,45 +223,38 @@ def solve_problem_ne(mfld, verbose=False):
     if M.isSolidTorus():
         return set() 
 
-    idx = find_from(is_torus_fault, F)
-    if idx != None:
-        S = F.surface(idx)
-        LR = S.cutAlong()
-        LR.intelligentSimplify()
-        L, R = LR.triangulateComponents()
+    S = find_classified('is_torus_fault', C)
+    if S is not None:
+        L, R = S.components
         if verbose:
             s = "ne: {0} homeo. {1}: essential T2 at index {2} in {1}"
-            print(s.format(sig, material_sig, idx))
-        return solve_problem_ne(L,verbose).union(solve_problem_ne(R,verbose))
+            print(s.format(sig, material_sig, S.index))
+        return solve(L).union(solve(R))
     if verbose:
         print("{} is atoroidal".format(material_sig))
 
-    idx = find_from(is_mobius_band, F)
-    if idx != None:
+    S = find_classified('is_mobius_band', C)
+    if S is not None:
         if verbose:
             s = "ne: {0} homeo. {1}: M2 at index {2} in {1}"
-            print(s.format(sig, material_sig, idx))
-        S = F.surface(idx)
-        Mp = S.cutAlong()
-        Mp.intelligentSimplify()
-        return solve_problem_ne(Mp,verbose)
+            print(s.format(sig, material_sig, S.index))
+        Mp = S.simplified_cut
+        return solve(Mp)
 
     # At this point, the only possible nonseparating nonclosed fault is an annulus. 
-    idx = find_from(is_nonseparating_nonclosed_fault, F)
-    if idx != None:
+    S = find_classified('is_nonseparating_nonclosed_fault', C)
+    if S is not None:
         if verbose:
             s = "ne: {0} homeo. {1}: nonseparating A2 at index {2} in {1}"
-            print(s.format(sig, material_sig, idx))
-        S = F.surface(idx)
-        Mp = S.cutAlong()
-        Mp.intelligentSimplify()
-        return solve_problem_ne(Mp, verbose)
-
-    idx = find_from(is_solid_torus_annulus, F)
-    if idx != None:
+            print(s.format(sig, material_sig, S.index))
+        Mp = S.simplified_cut
+        return solve(Mp)
+
+    S = find_classified('is_solid_torus_annulus', C)
+    if S is not None:
         if verbose:
             s = "ne: {0} homeo. {1}: s.t.s. A2 at index {2} in {1}"
-            print(s.format(sig, material_sig, idx))
+            print(s.format(sig, material_sig, S.index))
         return set()
     if verbose:
         print("{} is not two solid tori".format(material_sig))
@@ -141,3 +266,36 @@ def solve_problem_ne(mfld, verbose=False):
         print("ne: {0} homeo. {1}: faultless".format(sig, material_sig))
     raise Exception('faultless manifold')
 
+def cached_solve_problem_ne(mfld, verbose=False, cache=None, memo=None,
+                            stream=False, trials=20, patience=None, workers=None):
+    """As solve_problem_ne, but consults and updates the persistent cache
+    at the path cache, keyed by the isosig of mfld. Streamed answers
+    are kept apart from the others, since they may differ.
+    The plain Exceptions and AssertionErrors solve_problem_ne raises
+    are cached and raised again; other errors, such as MemoryError,
+    may not recur, and are not cached."""
+    mfld = prepare(mfld)
+    solve = lambda: solve_problem_ne(mfld, verbose, memo, stream,
+                                     trials, patience, workers)
+    if cache is None:
+        return solve()
+    sig = mfld.sig
+    stamp = regina_stamp()
+    kind = "ne_stream" if stream else "ne"
+    entry = cache_get(cache, kind, stamp, sig)
+    if entry is None:
+        try:
+            entry = {"sigs": sorted(solve())}
+        except Exception as x:
+            if type(x) in [Exception, AssertionError]:
+                entry = {"error": type(x).__name__, "message": str(x)}
+                cache_put(cache, kind, stamp, sig, entry)
+            raise
+        cache_put(cache, kind, stamp, sig, entry)
+    elif verbose:
+        print("ne: {0}: cached".format(sig))
+    if "error" in entry:
+        if entry["error"] == "AssertionError":
+            raise AssertionError(entry["message"])
+        raise Exception(entry["message"])
+    return set(entry["sigs"])
@@ -0,0 +1,102 @@
+import regina
+from functools import cached_property
+from .events import simplify
+
+class PreparedManifold:
+    """A 3-manifold, given by a triangulation or an isosig,
+    together with the derived forms and invariants the checks use.
+    Each is computed on first use and then shared, so passing one
+    PreparedManifold from check to check computes each at most once.
+    The triangulations it hands out are shared too: copy before modifying."""
+
+    def __init__(self, mfld):
+        # A copy, so later changes to mfld do not reach us.
+        self.given = regina.Triangulation3(mfld)
+
+    @cached_property
+    def sig(self):
+        return self.given.isoSig()
+
+    @cached_property
+    def truncated(self):
+        """The given triangulation with its ideal vertices truncated."""
+        T = regina.Triangulation3(self.given)
+        T.idealToFinite()
+        return T
+
+    @cached_property
+    def truncated_sig(self):
+        return self.truncated.isoSig()
+
+    @cached_property
+    def material(self):
+        """A simplified material triangulation, rebuilt from its isosig
+        so that its labelling is canonical."""
+        T = regina.Triangulation3(self.truncated)
+        simplify(T)
+        return regina.Triangulation3(T.isoSig())
+
+    @cached_property
+    def material_sig(self):
+        return self.material.isoSig()
+
+    @cached_property
+    def ideal(self):
+        """A simplified triangulation with boundary coned to ideal vertices.
+        N.B. finiteToIdeal does not necessarily yield an ideal triangulation."""
+        T = regina.Triangulation3(self.given)
+        T.finiteToIdeal()
+        simplify(T)
+        return T
+
+    @cached_property
+    def ideal_sig(self):
+        return self.ideal.isoSig()
+
+    @cached_property
+    def connected(self):
+        return self.material.isConnected()
+
+    @cached_property
+    def orientable(self):
+        return self.material.isOrientable()
+
+    @cached_property
+    def boundary_count(self):
+        return self.material.countBoundaryComponents()
+
+    @cached_property
+    def boundary_eulers(self):
+        """The Euler characteristics of the boundary components."""
+        return [cpt.build().eulerChar()
+                for cpt in self.material.boundaryComponents()]
+
+    @cached_property
+    def homology(self):
+        return self.material.homology()
+
+    @cached_property
+    def homology_rel(self):
+        return self.material.homologyRel()
+
+    @cached_property
+    def homology_bdry(self):
+        return self.material.homologyBdry()
+
+    @cached_property
+    def fundamental_group(self):
+        """A simplified presentation of the fundamental group,
+        read off from the given triangulation."""
+        G = self.given.fundamentalGroup()
+        G.intelligentSimplify()
+        return G
+
+    @cached_property
+    def has_strict_angle_structure(self):
+        return self.ideal.hasStrictAngleStructure()
+
+def prepare(mfld):
+    """mfld as a PreparedManifold, without preparing it again if it is one."""
+    if isinstance(mfld, PreparedManifold):
+        return mfld
+    return PreparedManifold(mfld)
@@ -1,31 +1,27 @@
-import regina
+from multiprocessing import Pool
+from .prepared import prepare
 
 def is_nontrivial_link_exterior(mfld):
-    M = regina.Triangulation3(mfld)
-    M.idealToFinite()
-    M.intelligentSimplify()
-    if not M.isConnected():
+    P = prepare(mfld)
+    if not P.connected:
         return False
-    if not M.isOrientable():
+    if not P.orientable:
         return False
-    if M.countBoundaryComponents() == 0:
+    if P.boundary_count == 0:
         return False
-    for cpt in M.boundaryComponents():
-        t = cpt.build()
-        if not t.eulerChar() == 0:
+    for chi in P.boundary_eulers:
+        if not chi == 0:
             return False
     else:
         return True
 
 def is_closed_oriented(mfld):
-    M = regina.Triangulation3(mfld)
-    M.idealToFinite()
-    M.intelligentSimplify()
-    if not M.isConnected():
+    P = prepare(mfld)
+    if not P.connected:
         return False
-    if not M.isOrientable():
+    if not P.orientable:
         return False
-    if M.countBoundaryComponents() > 0:
+    if P.boundary_count > 0:
         return False
     return True
 
@@ -42,23 +38,55 @@ def is_common_axis_equation(expr):
     l = expr.terms()
     return len(l) == 2
 
-def has_common_axis_obstruction(mfld):
-    G = mfld.fundamentalGroup()
-    G.intelligentSimplify()
+def common_axis_connected(G):
+    """Whether the generators of the presentation G are all joined
+    by common axis relations, found by union-find."""
     n = G.countGenerators()
-    CA = {i:set() for i in range(n)}
+    parent = list(range(n))
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+    components = n
     for r in G.relations():
         if is_common_axis_commutator(r) or is_common_axis_equation(r):
-            gx,gy = r.generator(0), r.generator(1)
-            CA[gx].add(gy)
-            CA[gy].add(gx)
-    # CA_P is now in CA represented by adjacency sets.
-    # Now check if CA_P is connected via depth-first search.
-    novel = [True for i in range(n)]
-    def depth_first(x):
-        if novel[x]:
-            novel[x] = False
-            for y in CA[x]:
-                depth_first(y)
-    depth_first(0)
-    return all(not x for x in novel)
+            gx, gy = find(r.generator(0)), find(r.generator(1))
+            if gx != gy:
+                parent[gx] = gy
+                components -= 1
+    # With no generators at all, the group is trivial.
+    return components <= 1
+
+# Verdicts by isosig, so that each group is computed and simplified once
+# per process, however many times a manifold is asked about.
+common_axis_memo = {}
+
+def clear_common_axis_memo():
+    common_axis_memo.clear()
+
+def has_common_axis_obstruction(mfld):
+    P = prepare(mfld)
+    if P.sig not in common_axis_memo:
+        common_axis_memo[P.sig] = common_axis_connected(P.fundamental_group)
+    return common_axis_memo[P.sig]
+
+def common_axis_verdict(sig):
+    return has_common_axis_obstruction(sig)
+
+def common_axis_screen(sigs, workers=None):
+    """Returns a dict from the isosigs sigs to whether each has the
+    common axis obstruction, and so no nonelementary embeddings.
+    With workers > 1, the groups are computed on a process pool.
+    The verdicts are also kept in common_axis_memo, where processes
+    forked afterwards find them."""
+    todo = [sig for sig in dict.fromkeys(sigs) if sig not in common_axis_memo]
+    if workers is not None and workers > 1 and len(todo) > 1:
+        chunksize = max(1, len(todo) // (4 * workers))
+        with Pool(workers) as pool:
+            verdicts = pool.map(common_axis_verdict, todo, chunksize)
+    else:
+        verdicts = [common_axis_verdict(sig) for sig in todo]
+    for sig, verdict in zip(todo, verdicts):
+        common_axis_memo[sig] = verdict
+    return {sig: common_axis_memo[sig] for sig in sigs}
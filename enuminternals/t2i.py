@@ -1,21 +1,36 @@
 import regina
+from .events import simplify
+from .prepared import prepare
+
+# Per-process memos keyed by isosig. Torus fault tests see the same
+# pieces over and over, so each is screened and recognized only once.
+homology_T2xI_memo = {}
+T2xI_memo = {}
+
+def clear_T2xI_memos():
+    homology_T2xI_memo.clear()
+    T2xI_memo.clear()
 
 def is_homology_T2xI(M):
-    mfld = regina.Triangulation3(M)
-    mfld.idealToFinite()
-    mfld.intelligentSimplify()
-    if not mfld.isConnected():
+    P = prepare(M)
+    if P.sig not in homology_T2xI_memo:
+        homology_T2xI_memo[P.sig] = homology_screen(P)
+    return homology_T2xI_memo[P.sig]
+
+def homology_screen(P):
+    """Whether the PreparedManifold P has the homology of T2xI."""
+    if not P.connected:
         return False
-    x = mfld.countBoundaryComponents()
+    x = P.boundary_count
     if x != 2:
         return False
-    h1 = mfld.homology()
+    h1 = P.homology
     if h1.str() != '2 Z':
         return False
-    h1r = mfld.homologyRel()
+    h1r = P.homology_rel
     if h1r.str() != 'Z':
         return False
-    bh1 = mfld.homologyBdry()
+    bh1 = P.homology_bdry
     if bh1.str() != '4 Z':
         return False
     return True
@@ -46,7 +61,7 @@ def get_coembedded_boundary_edge(mfld):
         return None
 
 def simplify_boundary(mfld):
-    mfld.intelligentSimplify()
+    simplify(mfld)
     em = get_embedded_boundary_edge(mfld)
     while em != None:
         mfld.layerOn(em)
@@ -56,19 +71,37 @@ def simplify_boundary(mfld):
             coem = get_coembedded_boundary_edge(mfld)
         em = get_embedded_boundary_edge(mfld)
 
+def closes_to_solid_torus(sig, e):
+    """Whether closing the book along edge e of the triangulation sig
+    gives a solid torus."""
+    S = regina.Triangulation3(sig)
+    S.closeBook(S.face(1,e), False, True)
+    return S.isSolidTorus()
+
 def is_T2xI(mfld):
-    T = regina.Triangulation3(mfld)
-    T.idealToFinite()
-    T.intelligentSimplify()
-    if not is_homology_T2xI(T):
+    """Whether mfld is homeomorphic to T2xI.
+    Verdicts are memoized by isosig. The check stops
+    at the first edge that does not give a solid torus."""
+    P = prepare(mfld)
+    if P.sig in T2xI_memo:
+        return T2xI_memo[P.sig]
+    sig = P.material_sig
+    if sig not in T2xI_memo:
+        T2xI_memo[sig] = T2xI_verdict(P)
+    T2xI_memo[P.sig] = T2xI_memo[sig]
+    return T2xI_memo[sig]
+
+def T2xI_verdict(P):
+    if not is_homology_T2xI(P):
         return False
+    T = regina.Triangulation3(P.material)
     simplify_boundary(T)
-    k = T.boundaryComponent(0)
-    for e in k.faces(1):
-        S = regina.Triangulation3(T)
-        f = S.face(1,e.index())
-        S.closeBook(f, False, True)
-        if not S.isSolidTorus():
+    # Rebuild from the isosig, so that edge labels,
+    # and hence the order of the checks, are canonical.
+    bdy_sig = T.isoSig()
+    T = regina.Triangulation3(bdy_sig)
+    for e in T.boundaryComponent(0).faces(1):
+        if not closes_to_solid_torus(bdy_sig, e.index()):
             return False
     return True
 
@@ -1,23 +1,152 @@
-from enuminternals.ne import solve_problem_ne
+from enuminternals.ne import cached_solve_problem_ne
 from enuminternals.quick_checks import *
+from enuminternals.prepared import prepare
+from enuminternals.cache import default_cache_path
+from options import option, int_option
+from gordon.crashsafe import crash_safe_results
+from time import perf_counter, process_time
+import json
 import sys
 import regina
 
+# Usage:
+#   get_ne_isosigs.py [--trial-workers=N] SIG [OUTFILE]
+#   get_ne_isosigs.py --batch=OUT.jsonl [--workers=N] [--shard=I/K] [FILE ...]
+#
+# In batch mode, isosigs are read one per line from the FILEs
+# (e.g. enuminternals/bead7.json), or from stdin if there are none
+# or FILE is -. With --shard=I/K, only the I-th of every K sigs is done.
+# One JSON line per sig is appended to OUT.jsonl as soon as it is done.
+# Sigs already recorded there as ok or skipped are not done again,
+# so a killed run can be restarted, and errors are retried.
+# Sigs with the common axis obstruction are screened out up front,
+# and recorded with no ne_sigs without any normal surface work.
+# Add --no-cache to bypass the persistent solve_problem_ne cache.
+# --trials=N and --patience=N go to best_material_sig, in either mode;
+# --trial-workers=N runs its trials on a pool, in single-sig mode only.
+
+def read_sigs(fns):
+    sigs = []
+    for fn in fns:
+        if fn == "-":
+            lines = sys.stdin.read().splitlines()
+        else:
+            with open(fn, 'r', encoding='utf-8') as f:
+                lines = f.read().splitlines()
+        sigs.extend(line.strip() for line in lines if line.strip())
+    return sigs
+
+def done_sigs(out):
+    """The sigs recorded in out as ok or skipped.
+    Sigs recorded only with errors are tried again."""
+    done = set()
+    try:
+        with open(out, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    if record["status"] in ["ok", "skipped"]:
+                        done.add(record["sig"])
+                except (ValueError, KeyError):
+                    # A line cut short when the last run was killed.
+                    pass
+    except FileNotFoundError:
+        pass
+    return done
+
+def parses(sig):
+    try:
+        regina.Triangulation3(sig)
+        return True
+    except Exception:
+        return False
+
+def solve_sig(job):
+    sig, cache, obstructed, trials, patience = job
+    wall, cpu = perf_counter(), process_time()
+    record = {"sig": sig}
+    try:
+        mfld = prepare(sig)
+        if not (is_nontrivial_link_exterior(mfld) and mfld.boundary_count in [2,3]):
+            record["status"] = "skipped"
+        elif obstructed:
+            record["status"] = "ok"
+            record["ne_sigs"] = []
+            record["screened"] = "common axis"
+        else:
+            ne_sigs = cached_solve_problem_ne(mfld, cache=cache, trials=trials,
+                                              patience=patience)
+            record["status"] = "ok"
+            record["ne_sigs"] = sorted(ne_sigs)
+    except Exception as x:
+        record["status"] = "error"
+        record["error"] = str(x)
+    record["seconds"] = perf_counter() - wall
+    record["cpu_seconds"] = process_time() - cpu
+    return record
+
+def solve_sig_crashed(job):
+    return {"sig": job[0], "status": "error", "error": "worker crashed"}
+
+def run_batch(out, fns, workers, shard, cache, trials=20, patience=None):
+    sigs = list(dict.fromkeys(read_sigs(fns or ["-"])))
+    if shard is not None:
+        i, k = [int(x) for x in shard.split("/")]
+        sigs = sigs[i::k]
+    done = done_sigs(out)
+    todo = [sig for sig in sigs if sig not in done]
+    print(f"batch: {len(sigs)} sigs, {len(sigs) - len(todo)} already done")
+    # Obstructed sigs are settled here, before any surface work is scheduled.
+    # Unreadable sigs are left for solve_sig to report.
+    obstructed = common_axis_screen([sig for sig in todo if parses(sig)], workers)
+    print(f"batch: {sum(obstructed.values())} sigs obstructed")
+    jobs = [(sig, cache, False, trials, patience)
+            for sig in todo if not obstructed.get(sig)]
+    with open(out, 'a', encoding='utf-8') as fl:
+        for sig in todo:
+            if obstructed.get(sig):
+                job = (sig, cache, True, trials, patience)
+                fl.write(json.dumps(solve_sig(job)) + "\n")
+        fl.flush()
+        if workers > 1:
+            records = (record for (i, record) in
+                       crash_safe_results(solve_sig, jobs, workers, solve_sig_crashed))
+        else:
+            records = map(solve_sig, jobs)
+        for record in records:
+            fl.write(json.dumps(record) + "\n")
+            fl.flush()
+            print(f"{record['sig']}: {record['status']}")
+
 if __name__ == "__main__":
-    sig = sys.argv[1]
+    cache = None if "--no-cache" in sys.argv else default_cache_path()
+    trials = int_option(sys.argv, "--trials", 20)
+    patience = int_option(sys.argv, "--patience")
+    out = option(sys.argv, "--batch")
+    if out is not None:
+        workers = int_option(sys.argv, "--workers", 1)
+        shard = option(sys.argv, "--shard")
+        fns = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+        run_batch(out, fns, workers, shard, cache, trials, patience)
+        sys.exit(0)
+    trial_workers = int_option(sys.argv, "--trial-workers")
+    args = [arg for arg in sys.argv if not arg.startswith("--")]
+    sig = args[1]
     print(f"{sig}: start")
-    mfld = regina.Triangulation3(sig)
-    if is_nontrivial_link_exterior(mfld) and mfld.countBoundaryComponents() in [2,3]:
+    mfld = prepare(sig)
+    if is_nontrivial_link_exterior(mfld) and mfld.boundary_count in [2,3]:
         X = ""
         try:
-            ne_sigs = solve_problem_ne(mfld)
+            ne_sigs = cached_solve_problem_ne(mfld, cache=cache, trials=trials,
+                                              patience=patience,
+                                              workers=trial_workers)
             for ne_sig in ne_sigs:
                 X += ne_sig + "\n"
         except Exception as x:
             X = x
-        if len(sys.argv) == 2:
+        if len(args) == 2:
             print(X)
         else:
-            with open(sys.argv[2], 'w') as fl:
+            with open(args[2], 'w') as fl:
                 fl.write(X)
     print(f"{sig}: finished")
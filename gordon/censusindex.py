@@ -0,0 +1,188 @@
+# A local, read-only index from isosigs to census names and
+# hyperbolicity verdicts, so that hyp_census can answer most queries
+# with a binary search instead of a Regina census lookup.
+#
+# The file starts with one line of JSON describing it,
+# including the Regina version whose census databases it came from.
+# Then come fixed-width records sorted by isosig:
+# the isosig and the census name, each padded with NUL bytes,
+# and one byte T, F or ? for hyperbolic, not hyperbolic, or unknown.
+#
+# To build it, run
+#     python -m gordon.censusindex [--snappy] [--from-cache[=PATH]]
+#                                  [--from-events=FILE] [FILE ...]
+# where each FILE lists isosigs one per line, and --snappy adds
+# the triangulations of SnapPy's orientable cusped and closed censuses.
+# The entries of an existing index for the same Regina version are kept,
+# so the index can be grown run by run.
+#
+# hyp_census is mostly asked about the randomized isosigs generate_sigs
+# produces, which seldom are the census triangulations themselves.
+# So an index built from the censuses alone answers few queries;
+# expect most to fall through to regina.Census.lookup. To index the
+# isosigs actually queried, add those recorded by earlier runs:
+# --from-cache takes the isosigs hyp_info cached verdicts for (the
+# "hypsig" entries of the cache at PATH, by default the usual cache),
+# and --from-events takes those of the census events in an events log
+# (see enuminternals/events.py). After a run over the same fillings
+# has been indexed this way, nearly every query of a rerun is a hit.
+
+import json
+import mmap
+import os
+import sys
+
+INDEX_FORMAT = 1
+
+VERDICT_CODES = {True: b'T', False: b'F', None: b'?'}
+CODE_VERDICTS = {b'T': True, b'F': False, b'?': None}
+
+def default_index_path():
+    path = os.environ.get("LOW_CUSP_VOLUME_CENSUS_INDEX")
+    if path:
+        return path
+    return os.path.join(os.path.expanduser("~"), ".cache",
+                        "low-cusp-volume", "census.idx")
+
+def write_census_index(path, regina_version, entries):
+    """Writes the index of entries, triples (sig, name, verdict)."""
+    table = {}
+    for (sig, name, verdict) in entries:
+        table[sig.encode('ascii')] = (name.encode('utf-8'), verdict)
+    sigs = sorted(table)
+    sig_width = max([len(sig) for sig in sigs], default=1)
+    name_width = max([len(table[sig][0]) for sig in sigs], default=1)
+    header = {"format": INDEX_FORMAT,
+              "regina": regina_version,
+              "count": len(sigs),
+              "sig_width": sig_width,
+              "name_width": name_width}
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, 'wb') as f:
+        f.write(json.dumps(header).encode('ascii') + b'\n')
+        for sig in sigs:
+            name, verdict = table[sig]
+            f.write(sig.ljust(sig_width, b'\0'))
+            f.write(name.ljust(name_width, b'\0'))
+            f.write(VERDICT_CODES[verdict])
+    os.replace(tmp, path)
+
+class CensusIndex:
+    """A census index file, memory-mapped for O(log n) lookups."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.header = json.loads(f.readline())
+            self.offset = f.tell()
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.count = self.header["count"]
+        self.sig_width = self.header["sig_width"]
+        self.name_width = self.header["name_width"]
+        self.width = self.sig_width + self.name_width + 1
+
+    def __len__(self):
+        return self.count
+
+    def key(self, i):
+        start = self.offset + i * self.width
+        return self.map[start:start + self.sig_width]
+
+    def __iter__(self):
+        """Yields (sig, name, verdict) for every entry."""
+        for i in range(self.count):
+            sig = self.key(i).rstrip(b'\0').decode('ascii')
+            name, verdict = self.lookup(sig)
+            yield (sig, name, verdict)
+
+    def lookup(self, sig):
+        """Returns (name, verdict) for sig, or None if sig is not indexed."""
+        sig = sig.encode('ascii')
+        if len(sig) > self.sig_width:
+            return None
+        key = sig.ljust(self.sig_width, b'\0')
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self.count or self.key(lo) != key:
+            return None
+        start = self.offset + lo * self.width + self.sig_width
+        name = self.map[start:start + self.name_width].rstrip(b'\0')
+        code = self.map[start + self.name_width:start + self.name_width + 1]
+        return (name.decode('utf-8'), CODE_VERDICTS[code])
+
+def load_census_index(path, regina_version):
+    """Returns the CensusIndex at path, or None if there is none,
+    or if it was built from a different version of Regina."""
+    if not os.path.exists(path):
+        return None
+    index = CensusIndex(path)
+    if (index.header.get("format") != INDEX_FORMAT
+        or index.header.get("regina") != regina_version):
+        s = "census index {0} is for Regina {1}, not {2}; ignoring it"
+        print(s.format(path, index.header.get("regina"), regina_version))
+        return None
+    return index
+
+def cached_sigs(path):
+    """The isosigs hyp_info has cached verdicts for in the cache at path."""
+    from enuminternals.cache import cache_keys
+    if not os.path.exists(path):
+        return []
+    return cache_keys(path, "hypsig")
+
+def event_sigs(fn):
+    """The isosigs of the census events in the events log fn."""
+    sigs = []
+    with open(fn, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("stage") == "census" and record.get("isosig"):
+                sigs.append(record["isosig"])
+    return sigs
+
+def snappy_census_sigs():
+    import snappy
+    for M in snappy.OrientableCuspedCensus:
+        yield M.triangulation_isosig(decorated=False)
+    for M in snappy.OrientableClosedCensus:
+        yield M.filled_triangulation().triangulation_isosig(decorated=False)
+
+if __name__ == "__main__":
+    import regina
+    from gordon.hyperbolicity import census_hits
+    from enuminternals.cache import default_cache_path
+    sigs = []
+    for fn in sys.argv[1:]:
+        if fn == "--snappy":
+            sigs.extend(snappy_census_sigs())
+        elif fn == "--from-cache":
+            sigs.extend(cached_sigs(default_cache_path()))
+        elif fn.startswith("--from-cache="):
+            sigs.extend(cached_sigs(fn.split("=", 1)[1]))
+        elif fn.startswith("--from-events="):
+            sigs.extend(event_sigs(fn.split("=", 1)[1]))
+        else:
+            with open(fn, 'r', encoding='utf-8') as f:
+                sigs.extend(line.strip() for line in f if line.strip())
+    path = default_index_path()
+    old = load_census_index(path, regina.versionString())
+    entries = list(old) if old is not None else []
+    known = set(entry[0] for entry in entries)
+    for sig in dict.fromkeys(sigs):
+        if sig in known:
+            continue
+        names = [hit.name() for hit in regina.Census.lookup(sig)]
+        verdict, name = census_hits(sig, names)
+        entries.append((sig, name, verdict))
+    write_census_index(path, regina.versionString(), entries)
+    print("Wrote {0} entries to {1}".format(len(entries), path))
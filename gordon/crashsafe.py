@@ -0,0 +1,56 @@
+# Runs jobs on a pool of worker processes, surviving worker crashes.
+#
+# SnapPy sometimes segfaults. A worker that dies breaks its whole pool,
+# and a multiprocessing.Pool would then wait forever for its results.
+# Here the jobs a broken pool left unfinished are run again on a fresh
+# pool, and if that breaks too, each in a process of its own,
+# so that a crash is pinned on the job that caused it.
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+def pool_round(f, jobs, indices, workers, broken):
+    """Yields (i, f(jobs[i])) for i in indices, as they finish,
+    on a pool of workers processes. Appends to broken the indices
+    left unfinished when the pool breaks."""
+    pool = ProcessPoolExecutor(workers)
+    try:
+        futures = {pool.submit(f, jobs[i]): i for i in indices}
+        for future in as_completed(futures):
+            try:
+                x = future.result()
+            except BrokenProcessPool:
+                broken.append(futures[future])
+                continue
+            yield (futures[future], x)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def crash_safe_results(f, jobs, workers, on_crash):
+    """Yields (i, f(jobs[i])) for each i, in the order they finish,
+    running f on a pool of workers processes. If a job crashes
+    its own process, on_crash(job) is yielded in place of its result.
+    Exceptions raised by f are raised here."""
+    indices = list(range(len(jobs)))
+    for attempt in range(2):
+        if not indices:
+            return
+        broken = []
+        yield from pool_round(f, jobs, indices, workers, broken)
+        indices = sorted(broken)
+    for i in indices:
+        broken = []
+        yield from pool_round(f, jobs, [i], 1, broken)
+        if broken:
+            yield (i, on_crash(jobs[i]))
+
+def crash_safe_map(f, jobs, workers, on_crash):
+    """Yields the results of crash_safe_results in the order of jobs,
+    each as soon as it and all those before it are done."""
+    done = {}
+    n = 0
+    for i, x in crash_safe_results(f, jobs, workers, on_crash):
+        done[i] = x
+        while n in done:
+            yield done.pop(n)
+            n += 1
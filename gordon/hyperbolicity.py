@@ -1,20 +1,27 @@
+import json
+import os
 import regina
 import snappy
+from enuminternals.cache import cache_get, cache_put, CACHE_FORMAT
+from enuminternals.events import event, simplify
+from enuminternals.prepared import prepare
+from .censusindex import load_census_index, default_index_path
+from .race import race
 from enuminternals.faultfinding import *
 from enuminternals.quick_checks import *
-from enuminternals.ne import find_from
 
-def hyp_regina(given_sig):
-    M = regina.Triangulation3(given_sig)
-    M.intelligentSimplify()
+def hyp_regina(given_sig, stream=False):
+    """Returns (verdict, reason), where verdict is whether given_sig
+    is hyperbolic, or None if this could not be decided.
+    With stream, vertex normal surfaces are tested as they are
+    enumerated, and enumeration stops at the first fault."""
+    P = prepare(given_sig)
     # Essential vtx surfaces are only guaranteed for material triangulations.
     # We therefore truncating all ideal vertices, then simplify.
-    M.idealToFinite()
-    M.intelligentSimplify()
-    material_sig = M.isoSig()
     # We want our surface labellings to be consistent.
-    # To do so, we fix the triangulation's labelling.
-    M = regina.Triangulation3(material_sig)
+    # So P.material has the labelling its isosig gives it.
+    M = P.material
+    material_sig = P.material_sig
     
     # pi1 obstructions
     if has_common_axis_obstruction(M):
@@ -24,55 +31,46 @@ def hyp_regina(given_sig):
         return (False, s.format(given_sig,material_sig))
 
     # Strict angle structures only exist for ideal triangulations.
-    mu = regina.Triangulation3(given_sig)
-    mu.finiteToIdeal()
     # N.B. finiteToIdeal does not necessarily yield an ideal triangulation.
     #      It may fail to crush all finite vertices into ideal vertices.
     #      In this case we will not get a strict angle structure.
-    mu.intelligentSimplify()
-    if mu.hasStrictAngleStructure():
+    if P.has_strict_angle_structure:
         s = "hyp_regina: {0} homeo. {1}: strict angle structure"
-        s = s.format(given_sig, mu.isoSig())
+        s = s.format(given_sig, P.ideal_sig)
         print(s)
         return (True, s)
 
     # We use the material triangulation M for the surface enumeration.
-    nsl = regina.NormalSurfaces
-    qvs = nsl(M, regina.NS_QUAD, regina.NS_VERTEX)
     # The literature only guarantees existence results for fundamental surfaces.
     # Happily, for our data set, vertex surfaces alone turn out to suffice.
-    
-    idx = find_from(is_nonseparating_fault, qvs)
-    if idx != None:
-        s = "hyp_regina: {0} homeo. {1}: nonsep. fault at {2} in {1}"
-        s = s.format(given_sig, material_sig, idx)
-        print(s)
-        return (False, s)
-
-    idx = find_from(is_essential_sphere, qvs)
-    if idx != None:
-        s = "hyp_regina: {0} homeo. {1}: essential S2 at {2} in {1}"
-        s = s.format(given_sig, material_sig, idx)
-        print(s)
-        return (False, s)
-
-    # Solid tori were already caught by the search for a nonseparating fault.
-    # if M.isSolidTorus():
-    #    return (False, "Solid torus")
-
-    idx = find_from(is_torus_fault, qvs)
-    if idx != None:
-        s = "hyp_regina: {0} homeo. {1}: torus fault at {2} in {1}"
-        s = s.format(given_sig, material_sig, idx)
-        print(s)
-        return (False, s)
+    #
+    # Solid tori are caught by the search for a nonseparating fault.
+    # Every fault below shows M is not hyperbolic, whatever the order
+    # we find them in. So when streaming, each surface is tested as
+    # soon as it is enumerated, and the first fault ends the search.
+    faults = [('is_nonseparating_fault', "nonsep. fault"),
+              ('is_essential_sphere', "essential S2"),
+              ('is_torus_fault', "torus fault"),
+              ('is_solid_torus_annulus', "solid torus A2 fault")]
+    C = []
+    for S in vertex_surfaces(M, stream):
+        C.append(S)
+        if not stream:
+            continue
+        for test, fault in faults:
+            if getattr(S, test):
+                s = "hyp_regina: {0} homeo. {1}: {2} at {3} in {1}"
+                s = s.format(given_sig, material_sig, fault, S.index)
+                print(s)
+                return (False, s)
 
-    idx = find_from(is_solid_torus_annulus, qvs)
-    if idx != None:
-        s = "hyp_regina: {0} homeo. {1}: solid torus A2 fault at {2} in {1}"
-        s = s.format(given_sig, material_sig, idx)
-        print(s)
-        return (False, s)
+    for test, fault in faults:
+        S = find_classified(test, C)
+        if S is not None:
+            s = "hyp_regina: {0} homeo. {1}: {2} at {3} in {1}"
+            s = s.format(given_sig, material_sig, fault, S.index)
+            print(s)
+            return (False, s)
 
     if M.hasBoundaryFacets():
         s = "hyp_regina: {0} homeo. {1}: faultless with nonempty boundary"
@@ -96,8 +94,28 @@ def hyp_snappy(snappy_mfld, verbose=False):
     # As of 2019/11/21, one cannot use ManifoldHP in this step.
     # That causes a segfault for v1060(-2,1)(0,0)!
     # print "hyp_snappy: {0}".format(M)
+    x = hyp_snappy_immediate(M)
+    if x[0] != None:
+        return x
+    for curve in M.dual_curves():
+        x = hyp_snappy_drill(M, curve)
+        if x[0] != None:
+            return x
+    return (None, '')
+
+def verify_hyperbolicity(M):
+    """M.verify_hyperbolicity()[0], as an event."""
+    with event("verify", isosig=lambda: M.triangulation_isosig(decorated=False),
+               tetrahedra=M.num_tetrahedra) as e:
+        verdict = M.verify_hyperbolicity()[0]
+        e.set(outcome=verdict)
+    return verdict
+
+def hyp_snappy_immediate(M):
+    """Tries to verify M hyperbolic as it is,
+    or after filling in one of its incomplete cusps."""
     try:
-        if M.verify_hyperbolicity()[0]:
+        if verify_hyperbolicity(M):
             s = 'hyp_snappy: {0}: immediate'
             s = s.format(M.triangulation_isosig(decorated=False))
             print(s)
@@ -111,28 +129,134 @@ def hyp_snappy(snappy_mfld, verbose=False):
         X = M.filled_triangulation([cusp,])
         if X.num_cusps() > 0:
             try:
-                if X.verify_hyperbolicity()[0]:
+                if verify_hyperbolicity(X):
                     s = 'hyp_snappy: {0}: after filling cusp {1} of {2}'
                     s = s.format(M.triangulation_isosig(decorated=False), cusp, M.num_cusps())
                     print(s)
                     return (True, s)
             except ZeroDivisionError:
                 pass
+    return (None, '')
 
-    for curve in M.dual_curves():
-        X = M.drill(curve)
-        X.dehn_fill([(1,0)])
-        try:
-            X.canonize()
-            assert X.verify_hyperbolicity()[0]
-            s = 'hyp_snappy: {0}: after drilling along {1}'
-            s = s.format(M.triangulation_isosig(decorated=False), curve)
-            print(s)
-            return (True, s)
-        except:
-            pass
+def hyp_snappy_drill(M, curve):
+    """Tries to verify M hyperbolic after drilling curve."""
+    X = M.drill(curve)
+    X.dehn_fill([(1,0)])
+    try:
+        X.canonize()
+        assert verify_hyperbolicity(X)
+        s = 'hyp_snappy: {0}: after drilling along {1}'
+        s = s.format(M.triangulation_isosig(decorated=False), curve)
+        print(s)
+        return (True, s)
+    except:
+        return (None, '')
+
+def snappy_of_sig(sig):
+    reg_N = regina.Triangulation3(sig)
+    return snappy.Manifold(snappy.ManifoldHP(reg_N.snapPea()))
+
+# Entrants for hyp_race, which rebuild their manifold from sig
+# in the worker process.
+def race_snappy_immediate(sig):
+    return hyp_snappy_immediate(snappy_of_sig(sig))
+
+def race_snappy_drill(sig, i, n):
+    """Drills the dual curves i, i+n, i+2n, ... in turn.
+    The curves are found here, in the worker, so that a crash
+    while finding them is isolated like any other."""
+    M = snappy_of_sig(sig)
+    for curve in M.dual_curves()[i::n]:
+        x = hyp_snappy_drill(M, curve)
+        if x[0] != None:
+            return x
     return (None, '')
 
+def race_regina(sig):
+    return hyp_regina(sig, stream=True)
+
+# Wall-clock limits in seconds for each kind of entrant in hyp_race.
+# A drill entrant's limit covers all of its share of the dual curves.
+RACE_LIMITS = {"snappy": 60, "drill": 60, "regina": 600}
+
+def hyp_race(sig, verbose=False, limits=None, workers=None):
+    """Like hyp_sig, but after the census, races SnapPy,
+    drilling along the dual curves, and Regina against one another
+    in at most workers processes, by default one per CPU.
+    The dual curves are shared out among workers - 2 drill entrants.
+    limits overrides entries of RACE_LIMITS."""
+    is_hyp = hyp_census(sig)
+    if not is_hyp[0] == None:
+        return is_hyp
+    if workers is None:
+        workers = os.cpu_count() or 1
+    L = dict(RACE_LIMITS)
+    L.update(limits or {})
+    n = max(1, workers - 2)
+    entrants = [(race_snappy_immediate, (sig,), L["snappy"]),
+                (race_regina, (sig,), L["regina"])]
+    entrants += [(race_snappy_drill, (sig, i, n), L["drill"])
+                 for i in range(n)]
+    return race(entrants, workers, verbose)
+
+def census_verdict(name):
+    """Whether the census manifold called name is hyperbolic,
+    or None if its name does not tell us."""
+    if name[0:3] == 'Hyp':
+        # A hyperbolic manifold from the closed orientable census.
+        return True
+    elif name[0] in "0123456789" and name[1] == '.':
+        # This is a manifold from the closed hyperbolic census.
+        # Its name begins with its volume estimate.
+        return True
+    elif name[0] in "msvt" or name[0:2] == "o9":
+        # This is a manifold from the cusped orientable hyperbolic census.
+        return True
+    elif name[0] in "0123456789" and name.split('a')[1][0] == 'h': 
+        # This is a hyperbolic manifold from the prime knot census.
+        return True
+
+    elif name[0:2] == 'L(':
+        # A lens space.
+        return False
+    elif name[0:3] == 'SFS':
+        return False
+    elif name[0:5] == "T x I":
+        return False
+    elif name[0:2] == "S3":
+        return False
+    elif name[0:3] == "RP3":
+        return False
+    elif name[0:7] == "S2 x S1":
+        return False
+    elif name[0] in "0123456789" and name.split('a')[1][0] != 'h':
+        # This is a nonhyperbolic manifold from the prime knot census.
+        return False
+
+    elif name[0] == 'L' and name[1] in "12345":
+        # In the Christy knot and link census.
+        # In this census the first digit is the number of components.
+        # This census goes up to 5 components.
+        # Whence "12345" instead of "0123456789".
+        #
+        # This census has both nonhyperbolic and hyperbolic elements.
+        # For instance, L108019 is a Seifert-fibered space.
+        return None
+    else:
+        raise Exception("hyp_census: {0}: new name type: " + name)
+
+def census_hits(sig, names):
+    """Returns (verdict, name) from the first of the census names
+    found for sig that settles its hyperbolicity, or (None, '')."""
+    for name in names:
+        verdict = census_verdict(name)
+        if verdict != None:
+            return (verdict, name)
+    return (None, '')
+
+# Loaded on first use by hyp_census; False until then.
+census_index = False
+
 def hyp_census(sig):
     # The following code works for Regina version 7.3.
     # The user will have to modify it appropriately for different versions.
@@ -142,60 +266,29 @@ def hyp_census(sig):
     # String literals are automatically in Unicode in Python3.
     if not (vs == '7.3'): # As of 2023-07-31 sagedocker has version 7.3 installed.
         raise Exception("Unknown version of Regina")
-    hits = regina.Census.lookup(sig)
-    x = (None, "hyp_census: " + sig)
-    for hit in hits: 
-        name = hit.name()
-        if name[0:3] == 'Hyp':
-            # A hyperbolic manifold from the closed orientable census.
-            x = (True, "hyp_census: {0}: {1}".format(sig,name))
-        elif name[0] in "0123456789" and name[1] == '.':
-            # This is a manifold from the closed hyperbolic census.
-            # Its name begins with its volume estimate.
-            x = (True, "hyp_census: {0}: {1}".format(sig,name))
-        elif name[0] in "msvt" or name[0:2] == "o9":
-            # This is a manifold from the cusped orientable hyperbolic census.
-            x = (True, "hyp_census: {0}: {1}".format(sig,name))
-        elif name[0] in "0123456789" and name.split('a')[1][0] == 'h': 
-            # This is a hyperbolic manifold from the prime knot census.
-            x = (True, "hyp_census: {0}: {1}".format(sig,name))
-            
-        elif name[0:2] == 'L(':
-            # A lens space.
-            x = (False, "hyp_census: {0}: {1}".format(sig,name))
-        elif name[0:3] == 'SFS':
-            x = (False, "hyp_census: {0}: {1}".format(sig,name))
-        elif name[0:5] == "T x I":
-            x = (False, "hyp_census: {0}: {1}".format(sig,name))
-        elif name[0:2] == "S3":
-            x = (False, "hyp_census: {0}: {1}".format(sig,name))
-        elif name[0:3] == "RP3":
-            x = (False, "hyp_census: {0}: {1}".format(sig,name))
-        elif name[0:7] == "S2 x S1":
-            x = (False, "hyp_census: {0}: {1}".format(sig,name))
-        elif name[0] in "0123456789" and name.split('a')[1][0] != 'h':
-            # This is a nonhyperbolic manifold from the prime knot census.
-            x = (False, "hyp_census: {0}: {1}".format(sig,name))
-
-        elif name[0] == 'L' and name[1] in "12345":
-            # In the Christy knot and link census.
-            # In this census the first digit is the number of components.
-            # This census goes up to 5 components.
-            # Whence "12345" instead of "0123456789".
-            #
-            # This census has both nonhyperbolic and hyperbolic elements.
-            # For instance, L108019 is a Seifert-fibered space.
-            continue 
+    global census_index
+    if census_index is False:
+        census_index = load_census_index(default_index_path(), vs)
+    with event("census", isosig=sig) as e:
+        entry = None
+        if census_index is not None:
+            entry = census_index.lookup(sig)
+        if entry is not None:
+            verdict, name = entry[1], entry[0]
         else:
-            raise Exception("hyp_census: {0}: new name type: " + name)
-
-        if x[0] != None:
-            print(x[1])
-            break
-
+            hits = regina.Census.lookup(sig)
+            verdict, name = census_hits(sig, [hit.name() for hit in hits])
+        e.set(outcome=verdict)
+    if verdict == None:
+        return (None, "hyp_census: " + sig)
+    x = (verdict, "hyp_census: {0}: {1}".format(sig,name))
+    print(x[1])
     return x
 
 def generate_sigs(snappy_mfld, fuel, verbose=False):
+    """Yields distinct isosigs of the filled triangulation of snappy_mfld,
+    each as soon as it is found, beginning with the unrandomized one.
+    A consumer that stops early saves the remaining randomization."""
     # Regina does this more methodically.
     # But this function is not available in its Python bindings.
     # So we use the following jury-rigged alternative in SnapPy.
@@ -204,6 +297,7 @@ def generate_sigs(snappy_mfld, fuel, verbose=False):
     N = snappy_mfld.filled_triangulation()
     sig = N.triangulation_isosig(decorated=False)
     S = {sig}
+    yield sig
     while L > 0:
         x = x+1
         for i in range(fuel):
@@ -218,45 +312,87 @@ def generate_sigs(snappy_mfld, fuel, verbose=False):
                 N = M
             N.simplify()
             this_sig = N.triangulation_isosig(decorated=False)
-            if (this_sig not in S) and verbose:
-                print("new sig at ({0}.{1}.{2})".format(L,x,i))
-            S.add(this_sig)
+            if this_sig not in S:
+                if verbose:
+                    print("new sig at ({0}.{1}.{2})".format(L,x,i))
+                S.add(this_sig)
+                yield this_sig
         L = L // 2
-    X = [(len(sig),sig) for sig in S]
-    X.sort()
-    return [sig for (n,sig) in X]
 
-def hyp_info(mfld, cusp, slope, verbose=False):
+def hyp_stamp():
+    return "{0}:regina-{1}:snappy-{2}".format(CACHE_FORMAT,
+                                              regina.versionString(),
+                                              snappy.__version__)
+
+def filling_key(mfld, cusp, slope):
+    """A cache key for mfld, with its other fillings, filled along slope on cusp.
+    The decorated isosig fixes the framing in which slopes are read."""
+    fillings = [[float(x) for x in filling]
+                for (i, filling) in enumerate(mfld.cusp_info('filling'))
+                if i != cusp]
+    return json.dumps([mfld.name(),
+                       mfld.triangulation_isosig(decorated=True),
+                       fillings, int(cusp), [int(x) for x in slope]])
+
+def hyp_info(mfld, cusp, slope, verbose=False, cache=None, racing=False):
+    """Returns (verdict, reason), where verdict is whether
+    the filling of mfld along slope on cusp is hyperbolic.
+    If cache is a path, verdicts are kept there, both under the filling
+    and under every isosig of the filled manifold we generate.
+    With racing, the first isosig goes through hyp_race instead of hyp_sig."""
+    stamp = hyp_stamp() if cache is not None else None
+    key = filling_key(mfld, cusp, slope) if cache is not None else None
+    x = cache_get(cache, "hyp", stamp, key)
+    if x is not None:
+        return tuple(x)
     M = mfld.copy()
     M.dehn_fill(slope, cusp)
-    sigs = generate_sigs(M, 4)
     # 32 seems to be enough to get > 1 choice for v1060 consistently for Manifolds.
     # For instances of ManifoldHP, 4 suffices.
-
+    #
+    # Each signature goes through the census and SnapPy as soon as
+    # it is generated, so randomization stops at the first verdict.
+    sigs = []
+    for sig in generate_sigs(M, 4):
+        sigs.append(sig)
+        x = cache_get(cache, "hypsig", stamp, sig)
+        if x is None and racing and len(sigs) == 1:
+            x = hyp_race(sig, verbose)
+        elif x is None:
+            x = hyp_sig(sig, verbose)
+        if x[0] != None:
+            break
+    else:
+        x = hyp_last_resort(sigs, verbose)
+    x = tuple(x)
+    cache_put(cache, "hyp", stamp, key, list(x))
     for sig in sigs:
-        is_hyp = hyp_census(sig)
-        if not is_hyp[0] == None:
-            return is_hyp
+        cache_put(cache, "hypsig", stamp, sig, list(x))
+    return x
 
-    for sig in sigs:
-        reg_N = regina.Triangulation3(sig)
-        snp_N = snappy.ManifoldHP(reg_N.snapPea())
-        is_hyp = hyp_snappy(snp_N, verbose)
-        if not is_hyp[0] == None:
-            return is_hyp
+def hyp_sig(sig, verbose=False):
+    """Tries the census, then SnapPy, on the isosig sig."""
+    is_hyp = hyp_census(sig)
+    if not is_hyp[0] == None:
+        return is_hyp
+    reg_N = regina.Triangulation3(sig)
+    snp_N = snappy.ManifoldHP(reg_N.snapPea())
+    return hyp_snappy(snp_N, verbose)
 
-    sig = sigs[0]
+def hyp_last_resort(sigs, verbose=False):
+    """Tries Regina on the shortest of sigs,
+    for which the census and SnapPy have failed."""
+    sig = min(sigs, key=lambda sig: (len(sig), sig))
     N = regina.Triangulation3(sig)
-    x = hyp_regina(N)
+    x = hyp_regina(sig)
     if x[0] != None:
         return x
 
     # Take care of jLLLAAQacfggghiiinkgokohqkv.
-    N.simplifyExhaustive(2)
+    simplify(N, 2)
     x = hyp_census(N.isoSig())
     if x[0] != None:
         print("hyp_info: {0} simplifies to {1}".format(sig,N.isoSig()))
         return x
     
     raise Exception("Can't determine hyperbolicity of {0}".format(sig))
-
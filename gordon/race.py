@@ -0,0 +1,65 @@
+# Runs several strategies for the same question at once,
+# each in its own worker process, and keeps the first decisive answer.
+
+import time
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import wait
+
+def run_entrant(conn, f, args):
+    try:
+        x = tuple(f(*args))
+    except Exception as e:
+        x = (None, "{0}: {1}: {2}".format(f.__name__, type(e).__name__, e))
+    conn.send(x)
+    conn.close()
+
+def race(entrants, workers=None, verbose=False):
+    """Runs entrants, triples (f, args, limit), in worker processes,
+    at most workers at a time, in the order given.
+    Each f(*args) returns (verdict, reason), where verdict None is indecisive.
+    Returns the first decisive result to arrive, or (None, '') if none is.
+    An entrant still running after limit seconds (None for no limit)
+    is cancelled, and so are all the others once one has won."""
+    waiting = list(entrants)
+    running = {}
+    try:
+        while waiting or running:
+            while waiting and (workers is None or len(running) < workers):
+                f, args, limit = waiting.pop(0)
+                recv, send = Pipe(duplex=False)
+                p = Process(target=run_entrant, args=(send, f, args))
+                p.start()
+                send.close()
+                deadline = float('inf') if limit is None else time.monotonic() + limit
+                running[recv] = (p, deadline, f)
+            deadline = min(d for (p, d, f) in running.values())
+            timeout = None
+            if deadline < float('inf'):
+                timeout = max(0, deadline - time.monotonic())
+            for conn in wait(list(running), timeout):
+                p, d, f = running.pop(conn)
+                try:
+                    x = conn.recv()
+                except EOFError:
+                    # The worker died without answering, e.g. by a segfault.
+                    x = (None, "{0}: crashed".format(f.__name__))
+                conn.close()
+                p.join()
+                if verbose and x[0] == None:
+                    print("race: {0}: no verdict {1}".format(f.__name__, x[1]))
+                if x[0] != None:
+                    return x
+            now = time.monotonic()
+            for conn in [c for c in running if running[c][1] <= now]:
+                p, d, f = running.pop(conn)
+                p.terminate()
+                p.join()
+                conn.close()
+                if verbose:
+                    print("race: {0}: out of time".format(f.__name__))
+        return (None, '')
+    finally:
+        for conn, (p, d, f) in running.items():
+            p.terminate()
+            p.join()
+            conn.close()
@@ -1,32 +1,71 @@
+import numpy as np
+
+def form_coefficients(Q):
+    """Returns (A, B, C) with Q(p,q) = A*p^2 + B*p*q + C*q^2.
+    Q may be such a triple already, or a quadratic form as a callable."""
+    if callable(Q):
+        A, C = Q(1,0), Q(0,1)
+        return (A, Q(1,1) - A - C, C)
+    return tuple(Q)
+
+def evaluate(coeffs, p, q):
+    """Q(p,q) for the form with coefficients coeffs.
+    Here p and q may be numbers or NumPy arrays of the same shape."""
+    A, B, C = coeffs
+    return A*p*p + B*p*q + C*q*q
+
 def verify(Q):
+    coeffs = form_coefficients(Q)
+    Q = lambda p, q: evaluate(coeffs, p, q)
     a,b,c,d = Q(1,0), Q(0,1), Q(1,1), Q(-1,1)
     e,f,g,h = b+c-a, b+d-a, a+c-b, a+d-b
     return e > 0 and f > 0 and g > 0 and h > 0
 
-def fold_until(op,e,stop,M):
-    if stop(M):
-        return e
-    (a,b,c,d) = M
-    L = fold_until(op,e,stop,(a,a+b,c,c+d))
-    R = fold_until(op,e,stop,(a+b,b,c+d,d))
-    return op(M,L,R)
-
-def union(l):
-    a = []
-    for s in l:
-        a = a + s
-    return a
+def as_array_scalars(coeffs, bound):
+    """Integer coefficients and bound stay exact; anything else becomes float.
+    Also returns the dtype in which to evaluate the form."""
+    values = list(coeffs) + [bound]
+    if all(isinstance(x, (int, np.integer)) for x in values):
+        return [int(x) for x in coeffs], int(bound), np.int64
+    return [float(x) for x in coeffs], float(bound), np.float64
 
 def short_slopes(Q, bound):
-    assert verify(Q)
+    """Returns the slopes (p,q) with Q(p,q) <= bound, up to sign.
+    Q is a quadratic form, given by coefficients (A, B, C) or as a callable.
+    The slopes other than (1,0),(0,1),(1,1),(-1,1) are found by walking
+    the Farey tree below four root matrices one level at a time,
+    evaluating Q on each whole level at once."""
+    coeffs = form_coefficients(Q)
+    assert verify(coeffs)
     J = [(1,0),(0,1),(1,1),(-1,1)]
-    Jp = [v for v in J if not (Q(v[0],v[1]) > bound)]
-    A = (1,1,0,1)
-    B = (1,0,1,1)
-    C = (-1,-1,1,0)
-    D = (0,-1,1,1)
-    too_big = lambda M: Q(M[0]+M[1], M[2]+M[3]) > bound
-    branch_set = lambda M,L,R: L + [M] + R
-    short_descendants = lambda M: fold_until(branch_set,[],too_big,M)
-    matrices = union(list(map(short_descendants, [A,B,C,D])))
-    return Jp + [(M[0]+M[1], M[2]+M[3]) for M in matrices]
+    Jp = [v for v in J if not (evaluate(coeffs, v[0], v[1]) > bound)]
+    coeffs, bound, dtype = as_array_scalars(coeffs, bound)
+    # Each row (a,b,c,d) stands for the slope (a+b, c+d),
+    # the mediant of its columns (a,c) and (b,d).
+    # Slopes are always integers; only Q may be evaluated in float.
+    frontier = np.array([(1,1,0,1),
+                         (1,0,1,1),
+                         (-1,-1,1,0),
+                         (0,-1,1,1)], dtype=np.int64)
+    root = np.arange(4)
+    ps, qs, roots = [], [], []
+    while len(frontier) > 0:
+        a, b, c, d = frontier.T
+        p, q = a + b, c + d
+        short = ~(evaluate(coeffs, p.astype(dtype), q.astype(dtype)) > bound)
+        frontier, root = frontier[short], root[short]
+        ps.append(p[short])
+        qs.append(q[short])
+        roots.append(root)
+        a, b, c, d = frontier.T
+        left = np.stack([a, a+b, c, c+d], axis=1)
+        right = np.stack([a+b, b, c+d, d], axis=1)
+        frontier = np.concatenate([left, right])
+        root = np.concatenate([root, root])
+    p = np.concatenate(ps)
+    q = np.concatenate(qs)
+    root = np.concatenate(roots)
+    # Below each root, q > 0 and the first column has the greater p/q.
+    # So sorting by root, then by decreasing p/q, puts each subtree in order.
+    order = np.lexsort((-(p / q), root))
+    return Jp + list(zip(p[order].tolist(), q[order].tolist()))
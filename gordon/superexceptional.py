@@ -2,33 +2,56 @@
 # then determines which among these manifolds is in fact superexceptional.
 
 import snappy
+from .crashsafe import crash_safe_map
 from .hyperbolicity import *
 
-def find_superexceptional_fillings(name, verbose=False):
+def find_superexceptional_fillings(name, verbose=False, cache=None, workers=None):
     supers = set()
     M = snappy.ManifoldHP(name)
     psf = {}
+    classified = {}
     if verbose:
         s = "fsx: Finding potential superexceptional fillings for {0}"
         print(s.format(name))
-    find_potential_superexceptional_fillings(M, psf, verbose=verbose)
+    find_potential_superexceptional_fillings(M, psf, verbose=verbose, cache=cache,
+                                             classified=classified, workers=workers)
     for cusp in range(M.num_cusps()):
         for filling in psf[cusp]:
-            mu = M.copy()
-            mu.dehn_fill(filling, cusp)
-            if verbose:
-                print("fsx: Determining if {0} is superexceptional".format(mu))
-            mu.canonize()
-            if verbose:
-                print("fsx: Canonized {0}".format(mu))
-            N = snappy.ManifoldHP(mu.filled_triangulation().canonical_retriangulation(verified=True))
+            if (filling, cusp) in classified:
+                # fpsx_2 already classified the short slopes of this filling,
+                # which is all is_superexceptional would do.
+                hyps, excs = classified[(filling, cusp)]
+                if verbose:
+                    s = "fsx: Reusing fpsx_2 classification of {0}{1} on cusp {2}"
+                    print(s.format(name, filling, cusp))
+                if len(excs) > 8:
+                    N = filled_canonical(M, cusp, filling, verbose)
+                    supers.add((name,cusp,filling,N.identify()[0].name()))
+                continue
+            N = filled_canonical(M, cusp, filling, verbose)
             if verbose:
-                print("fsx: Filled {0}: now running is_superexceptional".format(mu))
-            if is_superexceptional(N, verbose=verbose):
+                print("fsx: Filled {0}: now running is_superexceptional".format(N))
+            if is_superexceptional(N, verbose=verbose, cache=cache):
                 supers.add((name,cusp,filling,N.identify()[0].name()))
     return supers
 
-def find_potential_superexceptional_fillings(M, outdict, verbose=False):
+def filled_canonical(M, cusp, filling, verbose=False):
+    mu = M.copy()
+    mu.dehn_fill(filling, cusp)
+    if verbose:
+        print("fsx: Determining if {0} is superexceptional".format(mu))
+    mu.canonize()
+    if verbose:
+        print("fsx: Canonized {0}".format(mu))
+    return snappy.ManifoldHP(mu.filled_triangulation().canonical_retriangulation(verified=True))
+
+def find_potential_superexceptional_fillings(M, outdict, verbose=False, cache=None,
+                                             classified=None, workers=None):
+    """Puts in outdict[tau] the slopes on cusp tau of M which might give
+    superexceptional fillings. If classified is a dict, it receives
+    classified[(slope, tau)] = (hyp, exc) for the fillings classified
+    along the way, namely those along short hyperbolic slopes.
+    workers goes to classify_short_slopes."""
     assert M.num_cusps() == 2
     cusps = range(2)
 
@@ -40,7 +63,8 @@ def find_potential_superexceptional_fillings(M, outdict, verbose=False):
         if verbose:
             print("fpsx_1: Classifying slopes on cusp {0}".format(tau))
         cusp_hyp[tau], cusp_exc[tau] = set(), set()
-        classify_short_slopes(M, tau, cusp_hyp[tau], cusp_exc[tau], verbose=verbose)
+        classify_short_slopes(M, tau, cusp_hyp[tau], cusp_exc[tau],
+                              verbose=verbose, cache=cache, workers=workers)
 
     # Next we construct hyp and exc for fillings along short hyperbolic slopes.
     slope_hyp, slope_exc = {}, {}
@@ -64,7 +88,8 @@ def find_potential_superexceptional_fillings(M, outdict, verbose=False):
             slope_hyp[(slope,tau)], slope_exc[(slope,tau)] = set(), set()
             classify_short_slopes(N, 0,
                                   slope_hyp[(slope,tau)],
-                                  slope_exc[(slope,tau)], verbose=verbose)
+                                  slope_exc[(slope,tau)], verbose=verbose,
+                                  cache=cache, workers=workers)
 
     # Next we verify that $exc(\tau)$ is always at most 8.
     if verbose:
@@ -112,11 +137,14 @@ def find_potential_superexceptional_fillings(M, outdict, verbose=False):
         outdict[tau] = set()
         outdict[tau].update(cusp_hyp[tau])
         outdict[tau].update(long_maybe_superexc[tau])
+    if classified is not None:
+        for key in slope_exc:
+            classified[key] = (slope_hyp[key], slope_exc[key])
 
-def classify_short_slopes(mfld, cusp, hyps, excs, verbose=False):
-    """Classifies short slopes on cusp in mfld into hyp. and excs.
-    mfld with whatever Dehn fillings it has attached should be verifiably hyperbolic.
-    Otherwise short_slopes may raise an error or even dump core."""
+def short_slopes_on(mfld, cusp, verbose=False):
+    """Returns the short slopes on cusp in mfld, in the framing of mfld,
+    ordered from shortest to longest.
+    mfld should be verifiably hyperbolic, as for classify_short_slopes."""
     M = snappy.ManifoldHP(mfld)
     try:
         M.canonize()
@@ -130,19 +158,71 @@ def classify_short_slopes(mfld, cusp, hyps, excs, verbose=False):
                                   method='maximal',
                                   verified=True,
                                   first_cusps=[cusp,])
-    original_shorts = [(d*p-b*q, -c*p+a*q) for (p,q) in short_shorts[cusp]]
-    for slope in original_shorts:
-        if hyp_info(mfld, cusp, slope)[0]:
+    # In the shortest framing the meridian has length 1 relative
+    # to the cusp shape, so |p + q*shape| orders slopes by length.
+    shape = M.cusp_info(cusp)['shape']
+    shape = complex(float(shape.real()), float(shape.imag()))
+    shorts = sorted(short_shorts[cusp], key=lambda pq: abs(pq[0] + pq[1]*shape))
+    return [(d*p-b*q, -c*p+a*q) for (p,q) in shorts]
+
+def slope_verdict(job):
+    cls, text, cusp, slope, cache = job
+    mfld = cls(text)
+    return bool(hyp_info(mfld, cusp, slope, cache=cache)[0])
+
+def slope_verdict_crashed(job):
+    cls, text, cusp, slope, cache = job
+    s = "slope_verdicts: hyp_info crashed on {0}, cusp {1}, slope {2}"
+    raise Exception(s.format(cls(text), cusp, slope))
+
+def slope_verdicts(mfld, cusp, slopes, workers, cache=None):
+    """Returns the list of hyp_info verdicts for slopes on cusp of mfld,
+    computed on a pool of worker processes by crash_safe_map.
+    SnapPy sometimes segfaults, which breaks the whole pool; the slopes
+    left over go to a fresh pool, and only if that breaks too are they
+    tried one process each, to pin the crash on its slope."""
+    jobs = [(type(mfld), mfld._to_string(), cusp, slope, cache)
+            for slope in slopes]
+    return list(crash_safe_map(slope_verdict, jobs, workers, slope_verdict_crashed))
+
+def classify_short_slopes(mfld, cusp, hyps, excs, verbose=False, cache=None,
+                          workers=None):
+    """Classifies short slopes on cusp in mfld into hyp. and excs.
+    mfld with whatever Dehn fillings it has attached should be verifiably hyperbolic.
+    Otherwise short_slopes may raise an error or even dump core.
+    If cache is a path, hyp_info keeps its verdicts there.
+    With workers > 1, slopes are classified concurrently by slope_verdicts."""
+    original_shorts = short_slopes_on(mfld, cusp, verbose)
+    if workers is not None and workers > 1:
+        verdicts = slope_verdicts(mfld, cusp, original_shorts, workers, cache)
+    else:
+        verdicts = (hyp_info(mfld, cusp, slope, cache=cache)[0]
+                    for slope in original_shorts)
+    for slope, is_hyp in zip(original_shorts, verdicts):
+        if is_hyp:
             hyps.add(slope)
         else:
             excs.add(slope)
 
-def is_superexceptional(mfld,verbose=False):
+def is_superexceptional(mfld,verbose=False,cache=None,bounded=True):
+    """Whether mfld has more than 8 exceptional short slopes.
+    With bounded, slopes are classified shortest first, and we stop
+    as soon as 9 are exceptional, or too few slopes remain for 9."""
     assert mfld.num_cusps() == 1
     assert mfld.is_orientable()
     if mfld.num_tetrahedra() > 9:
         print(f"more than 9 tets: {mfld}")
-    hyps, excs = set(), set()
-    classify_short_slopes(mfld, 0, hyps, excs, verbose=verbose)
-    return len(excs) > 8
-
+    slopes = short_slopes_on(mfld, 0, verbose)
+    n = len(slopes)
+    excs = 0
+    calls = 0
+    for i, slope in enumerate(slopes):
+        if bounded and (excs > 8 or excs + (n - i) <= 8):
+            break
+        calls += 1
+        if not hyp_info(mfld, 0, slope, cache=cache)[0]:
+            excs += 1
+    if verbose:
+        s = "is_superexceptional: {0}: {1} of {2} hyp_info calls saved"
+        print(s.format(mfld, n - calls, n))
+    return excs > 8
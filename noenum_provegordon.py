@@ -1,9 +1,15 @@
 # from enuminternals.enuminternals import enumerate_internal_necklaces
 from gordon.superexceptional import *
 from snappy import *
+from enuminternals.cache import default_cache_path
+from options import int_option
 from time import process_time
+import sys
 
 reduced_neckls = ['s596', 's647', 's774', 's776', 's780', 's782', 's785', 'v2124', 'v2355', 'v2533', 'v2644', 'v2731', 'v3108', 'v3127', 'v3211', 'v3376']
+cache = None if "--no-cache" in sys.argv else default_cache_path()
+# With --workers=N, short slopes are classified on a pool of N processes.
+workers = int_option(sys.argv, "--workers")
 beginning = process_time()
 part2_start = process_time()
 sups = set()
@@ -13,7 +19,9 @@ for neckl in reduced_neckls:
         continue
     print("*** Working on {0} ***".format(neckl))
     neckl_start = process_time()
-    sups = sups.union(find_superexceptional_fillings(neckl, verbose=True))
+    sups = sups.union(find_superexceptional_fillings(neckl, verbose=True,
+                                                     cache=cache,
+                                                     workers=workers))
     print("*** Done with {0} in {1} seconds. ***\n".format(neckl,
                                                            process_time()
                                                            - neckl_start))
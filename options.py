@@ -0,0 +1,13 @@
+# Options given as NAME=VALUE on the command line, shared by the scripts.
+
+def option(argv, name, default=None):
+    """The value given by NAME=VALUE in argv, or default."""
+    for arg in argv:
+        if arg.startswith(name + "="):
+            return arg.split("=", 1)[1]
+    return default
+
+def int_option(argv, name, default=None):
+    """The integer given by NAME=N in argv, or default."""
+    value = option(argv, name)
+    return default if value is None else int(value)
@@ -1,20 +1,48 @@
 from enuminternals import enumerate_internal_necklaces
 from gordon.superexceptional import *
 from snappy import *
+from enuminternals.cache import default_cache_path
+from checkpoints import save_checkpoint, resumed, checkpoint_dir
+from options import int_option
 from time import process_time
+import sys
 
 if __name__ == "__main__":
+    cache = None if "--no-cache" in sys.argv else default_cache_path()
+    # With --resume, completed units saved in the checkpoint
+    # directory by an earlier run are not recomputed.
+    resume = "--resume" in sys.argv
+    stream = "--stream" in sys.argv
+    workers = int_option(sys.argv, "--workers")
+    trials = int_option(sys.argv, "--trials", 20)
+    patience = int_option(sys.argv, "--patience")
+    trial_workers = int_option(sys.argv, "--trial-workers")
+    ckpts = checkpoint_dir(sys.argv)
     beginning = process_time()
     print("*** Part 0: Enumerating the internal necklace structures ***")
     part0_start = process_time()
-    neckls = set()
-    for bead in [4,5,6,7]:
-        neckls = neckls.union(enumerate_internal_necklaces(bead, verbose=True))
+    names = resumed(ckpts, "part0", resume)
+    if names is None:
+        neckls = set()
+        for bead in [4,5,6,7]:
+            unit = "part0_bead{0}".format(bead)
+            bead_neckls = resumed(ckpts, unit, resume)
+            if bead_neckls is None:
+                bead_neckls = enumerate_internal_necklaces(bead, verbose=True,
+                                                           workers=workers,
+                                                           cache=cache,
+                                                           stream=stream,
+                                                           trials=trials,
+                                                           patience=patience,
+                                                           trial_workers=trial_workers)
+                save_checkpoint(ckpts, unit, bead_neckls)
+            neckls = neckls.union(bead_neckls)
+        names = list(neckls)
+        names.sort()
+        save_checkpoint(ckpts, "part0", names)
     print("------------------------------------")
     print("| The ancestral set is as follows: |")
     print("------------------------------------\n")
-    names = list(neckls)
-    names.sort()
     for neckl in names:
         print(neckl)
     print("\n*** Part 0: Finished in {0} seconds. ***\n".format(process_time()
@@ -22,19 +50,23 @@ if __name__ == "__main__":
 
     print("\n*** Part 1: Reducing the ancestral set. ***\n")
     part1_start = process_time()
-    reduced_neckls = set()
-    for neckl in names:
-        M = snappy.Manifold(neckl)
-        n = M.dual_curves()
-        matched = False
-        for i in range(len(n)):
-            x = M.drill(i)
-            for y in x.identify():
-                if y.name() in names:
-                    print("{0} is a Dehn filling of {1}".format(neckl, y.name()))
-                    matched = True
-        if not matched:
-            reduced_neckls.add(neckl)
+    reduced_neckls = resumed(ckpts, "part1", resume)
+    if reduced_neckls is None:
+        reduced_neckls = set()
+        for neckl in names:
+            M = snappy.Manifold(neckl)
+            n = M.dual_curves()
+            matched = False
+            for i in range(len(n)):
+                x = M.drill(i)
+                for y in x.identify():
+                    if y.name() in names:
+                        print("{0} is a Dehn filling of {1}".format(neckl, y.name()))
+                        matched = True
+            if not matched:
+                reduced_neckls.add(neckl)
+        save_checkpoint(ckpts, "part1", sorted(reduced_neckls))
+    reduced_neckls = set(reduced_neckls)
     print("\n*** Part 1: Finished in {0} seconds. ***\n".format(process_time()
                                                                 - part1_start))
 
@@ -1,10 +1,14 @@
 # Uses Snappy 2.8 in Sage 9.1
-from snappy import ManifoldHP
+from snappy import Manifold, ManifoldHP
 from snappy.verify.exceptions import ShapePositiveImaginaryPartNumericalVerifyError
-from gordon.hyperbolicity import hyp_info
+from gordon.hyperbolicity import hyp_info, verify_hyperbolicity
 from regina import Triangulation3
-from enuminternals.ne import solve_problem_ne
+from enuminternals.ne import cached_solve_problem_ne
+from enuminternals.cache import default_cache_path
 from sage.rings.real_mpfi import RealIntervalField 
+from gordon.crashsafe import crash_safe_map
+from options import int_option
+from time import perf_counter
 import sys
 
 def length_upper_bound_Futer_Kalfagianni_Purcell(mfld, vol_upper_bound):
@@ -13,7 +17,58 @@ def length_upper_bound_Futer_Kalfagianni_Purcell(mfld, vol_upper_bound):
     pi = RR.pi()
     return 2*pi*1/(1-((RR(2)/RR(3)*(RR(vol_upper_bound).log()-V.log())).exp())).square_root()
 
-fkp = length_upper_bound_Futer_Kalfagianni_Purcell
+# Precision tiers for verified computations, cheapest first:
+# 'double' is Manifold, 'quad-double' is ManifoldHP,
+# and 'bits' is ManifoldHP computing with bits_prec=high_bits.
+high_bits = 212
+# How many verified volumes, and how many FKP bounds, settled at each tier.
+volume_tiers = {'double': 0, 'quad-double': 0, 'bits': 0}
+fkp_tiers = {'double': 0, 'quad-double': 0}
+
+# The relative width of an FKP bound good enough to use.
+fkp_tolerance = 1e-9
+
+def at_precision(M, tier):
+    if tier == 'double':
+        return M if isinstance(M, Manifold) else M.low_precision()
+    return M if isinstance(M, ManifoldHP) else M.high_precision()
+
+def decisive(vol, bound):
+    """Whether the interval vol lies wholly to one side of bound."""
+    return bound is None or vol < bound or vol > bound
+
+def verified_volume(M, bound=None):
+    """Returns (vol, tier), where vol is a verified volume interval of M
+    from the cheapest tier at which verification succeeds and vol is
+    decisive relative to bound, if given. If the double tier fails
+    to verify, quad-double is tried, and its failure is raised.
+    Only a quad-double interval containing bound goes on to the bits tier."""
+    try:
+        vol = at_precision(M, 'double').volume(verified=True)
+        if decisive(vol, bound):
+            return (vol, 'double')
+    except Exception:
+        pass
+    N = at_precision(M, 'quad-double')
+    vol = N.volume(verified=True)
+    if decisive(vol, bound):
+        return (vol, 'quad-double')
+    return (N.volume(verified=True, bits_prec=high_bits), 'bits')
+
+def fkp(mfld, vol_upper_bound, tolerance=fkp_tolerance):
+    """The FKP length bound for mfld, computed at double precision,
+    or at quad-double if that is wider than tolerance relative to its size."""
+    try:
+        ell = length_upper_bound_Futer_Kalfagianni_Purcell(
+            at_precision(mfld, 'double'), vol_upper_bound)
+        if ell.relative_diameter() <= tolerance:
+            fkp_tiers['double'] += 1
+            return ell
+    except Exception:
+        pass
+    fkp_tiers['quad-double'] += 1
+    return length_upper_bound_Futer_Kalfagianni_Purcell(
+        at_precision(mfld, 'quad-double'), vol_upper_bound)
 
 def fkp_slopes(name, cusp, volume_bound, verbose=False):
     parent = ManifoldHP(name)
@@ -25,9 +80,47 @@ def fkp_slopes(name, cusp, volume_bound, verbose=False):
                             verified=True,   \
                             first_cusps=[cusp,])
     return all_short_cusp_slopes[cusp]
-        
+
+def closed_filling(job):
+    """Classifies the filling of N_name along slope on cusp, returning
+    (kind, datum, reason, seconds, tier), where kind is 'exceptional',
+    'closed' for a verified volume, or 'vol_failed' for an unverified one,
+    and tier is the precision tier of a verified volume."""
+    N_name, cusp, slope, bound, verbose, cache, racing = job
+    wall = perf_counter()
+    N = ManifoldHP(N_name)
+    (is_hyp, reason) = hyp_info(N, cusp, slope, verbose, cache, racing)
+    if is_hyp == None:
+        raise Exception("{0}{1} has unknown hyperbolicity".format(N_name, slope))
+    if not is_hyp:
+        return ('exceptional', None, reason, perf_counter() - wall, None)
+    N.dehn_fill(slope, cusp)
+    try:
+        vol, tier = verified_volume(N, bound)
+        return ('closed', (vol, N_name, slope), reason, perf_counter() - wall, tier)
+    except ShapePositiveImaginaryPartNumericalVerifyError:
+        return ('vol_failed', (N.volume(), N_name, slope), reason, perf_counter() - wall, None)
+
+def closed_filling_crashed(job):
+    s = "closed_filling crashed on {0}{1}"
+    raise Exception(s.format(job[0], job[2]))
+
+def closed_filling_jobs(jobs, workers):
+    """Yields closed_filling of each job, in the order of jobs,
+    on a pool of workers processes if workers > 1.
+    A job that crashes its process raises an exception here,
+    as it would have stopped a serial run."""
+    if workers <= 1:
+        for job in jobs:
+            yield closed_filling(job)
+        return
+    yield from crash_safe_map(closed_filling, jobs, workers, closed_filling_crashed)
+
 if __name__ == "__main__":
     verbose = True
+    cache = None if "--no-cache" in sys.argv else default_cache_path()
+    racing = "--race" in sys.argv
+    workers = int_option(sys.argv, "--workers", 1)
 
     # One cusped manifolds with volume at most 2.62 * 2 * v3 / sqrt(3)
     # Note, 3269644116 / 2**30 ~ 3.070518 is a close lower bound of this number.
@@ -48,7 +141,7 @@ if __name__ == "__main__":
             magic.dehn_fill(slope, 0)
             N_snappy = magic.filled_triangulation()
             N_regina = Triangulation3(N_snappy)
-            N_regina_sigs = solve_problem_ne(N_regina)
+            N_regina_sigs = cached_solve_problem_ne(N_regina, cache=cache)
             reg_to_snap = lambda sig: ManifoldHP(Triangulation3(sig).snapPea())
             N_snappy_pieces = [reg_to_snap(sig) for sig in N_regina_sigs]
             for piece in N_snappy_pieces:
@@ -78,14 +171,16 @@ if __name__ == "__main__":
             for cusp in [0,1]:
                 for slope in fkp_slopes(name, cusp, one_cusped_volume_bound, verbose):
                     M = ManifoldHP(name)
-                    (is_hyp, reason) = hyp_info(M, cusp, slope, verbose)
+                    (is_hyp, reason) = hyp_info(M, cusp, slope, verbose, cache, racing)
                     if verbose and not is_hyp:
                         print("{0}, cusp {1}, slope {2}: {3}".format(name, cusp, slope, reason))
                         continue
                     M.dehn_fill(slope, cusp)
                     N = M.filled_triangulation()
                     N.canonize()
-                    if N.volume(verified=True) > one_cusped_volume_bound:
+                    vol, tier = verified_volume(N, one_cusped_volume_bound)
+                    volume_tiers[tier] += 1
+                    if vol > one_cusped_volume_bound:
                         print("{0}, cusp {1}, slope {2}: volume > {3}".format(name, cusp, slope, one_cusped_volume_bound))
                         continue
                     print("{0}, cusp {1}, slope {2}: volume <~ {3} ".format(name, cusp, slope, one_cusped_volume_bound))
@@ -127,26 +222,33 @@ if __name__ == "__main__":
         print("Determining closed orientable hyperbolic 3-manifolds")
         print("of volume at most {0}".format(closed_volume_bound))
 
+        # With --workers=N, the (parent, slope) jobs run on a pool of N processes.
+        # Results are gathered in job order, as in the serial case.
+        # A race may use a process per CPU, so racing in every worker
+        # would overload the machine; the two are not combined.
+        job_racing = racing and workers <= 1
+        jobs = [(N_name, 0, slope, closed_volume_bound, verbose, cache, job_racing)
+                for N_name in one_cusped_list
+                for slope in fkp_slopes(N_name, 0, closed_volume_bound, verbose)]
         closed_fillings = []
         vol_failed = []
-        for N_name in one_cusped_list:
-            cusp = 0
-            for slope in fkp_slopes(N_name, cusp, closed_volume_bound, verbose):
-                N = ManifoldHP(N_name)
-                (is_hyp, reason) = hyp_info(N, cusp, slope, verbose)
-                if is_hyp == None:
-                    raise Exception("{0}{1} has unknown hyperbolicity".format(N_name, slope))
-                if not is_hyp:
-                    if verbose:
-                        print("{0}{1}: {2}".format(N_name, slope, reason))
-                    continue
-                N.dehn_fill(slope, cusp)
-                try:
-                    vol = N.volume(verified=True)
-                    closed_fillings.append((vol, N_name, slope))
-                    continue
-                except ShapePositiveImaginaryPartNumericalVerifyError:
-                    vol_failed.append((N.volume(), N_name, slope))
+        job_seconds = 0
+        wall = perf_counter()
+        for job, (kind, datum, reason, seconds, tier) in zip(jobs, closed_filling_jobs(jobs, workers)):
+            N_name, cusp, slope = job[0:3]
+            job_seconds += seconds
+            if verbose:
+                print("{0}{1}: {2} in {3:.2f} seconds".format(N_name, slope, kind, seconds))
+            if kind == 'exceptional':
+                if verbose:
+                    print("{0}{1}: {2}".format(N_name, slope, reason))
+            elif kind == 'closed':
+                closed_fillings.append(datum)
+                volume_tiers[tier] += 1
+            else:
+                vol_failed.append(datum)
+        s = "\n{0} closed filling jobs took {1:.2f} seconds in all, {2:.2f} seconds of wall time"
+        print(s.format(len(jobs), job_seconds, perf_counter() - wall))
 
         closed_fillings.sort()
         print("\nClosed fillings with volume verifiably at most {0}:".format(closed_volume_bound))
@@ -205,14 +307,14 @@ if __name__ == "__main__":
 
         M = ManifoldHP('m036(3,-1)')
         assert ManifoldHP('m007(3,2)').is_isometric_to(M)
-        assert M.verify_hyperbolicity()[0]
+        assert verify_hyperbolicity(M)
         v = M.volume(verified=True)
         print("\nm007(3,2) is isometric to m036(3,-1), with volume at least")
         print(v.lower())
 
         M = ManifoldHP('m027(3,1)')
         assert ManifoldHP('m006(4,1)').is_isometric_to(M)
-        assert M.verify_hyperbolicity()[0]
+        assert verify_hyperbolicity(M)
         v = M.volume(verified=True)
         print("\nm006(4,1) is isometric to m027(3,1), with volume at least")
         print(v.lower())
@@ -221,3 +323,6 @@ if __name__ == "__main__":
         print("\nm022(-1,2) coincidentally is also isometric to m027(3,1).")
         
                 
+
+    print("\nVerified volumes settled at each precision tier: {0}".format(volume_tiers))
+    print("FKP bounds settled at each precision tier: {0}".format(fkp_tiers))